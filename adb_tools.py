@@ -1,6 +1,11 @@
 import base64
+import collections
+import queue
 import re
+import secrets
+import struct
 import subprocess
+import threading
 import time
 
 import cv2
@@ -24,16 +29,219 @@ class Device:
         return self.raw_str
 
 
+class ShellSessionUnavailable(RuntimeError):
+    # The device cannot run shell sessions at all: `adb shell -T` is not
+    # supported before Android 7.
+    pass
+
+
+class RawCaptureUnsupported(RuntimeError):
+    # The device sends raw frames in a layout or pixel format that cannot be
+    # decoded.
+    pass
+
+
+class ShellSession:
+    # A long-lived `adb shell` of a device. Commands are written to its stdin
+    # one after another; every response ends with a line holding a random
+    # marker and the exit code of the command.
+
+    # What adb prints if the device has no shell protocol v2
+    __unsupportedError = re.compile(r"doesn't support")
+
+    def __init__(self, adb_path, serial, timeout=10):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.serial = serial
+        self.timeout = timeout
+        self.marker = f"--session-{secrets.token_hex(8)}--"
+        self.process = subprocess.Popen([adb_path, "-s", serial, "shell", "-T"], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Lines are read by threads, so that waiting for them can time out
+        # on every platform. Only the last lines of stderr are kept.
+        self.lines = queue.Queue()
+        self.ended = False
+        self.errors = collections.deque(maxlen=10)
+        self.reader = threading.Thread(target=self.__read, daemon=True)
+        self.reader.start()
+        self.error_reader = threading.Thread(target=self.__read_errors, daemon=True)
+        self.error_reader.start()
+        # An empty command shows at once whether the session works. A shell
+        # that never answers, or adb refusing -T, means that sessions are not
+        # supported; anything else, e.g. a lost connection, may pass.
+        try:
+            self.send("true")
+            self.receive()
+        except (OSError, RuntimeError) as exp:
+            unanswered = not self.ended
+            self.close()
+            self.error_reader.join(timeout=1)
+            error = " ".join(line.strip() for line in self.errors)
+            message = f"Cannot open shell session to {serial}: {error or exp}"
+            if unanswered or ShellSession.__unsupportedError.search(error):
+                raise ShellSessionUnavailable(message)
+            raise RuntimeError(message)
+        self.logger.debug("Opened shell session to %s", serial)
+
+    def __read(self):
+        for line in self.process.stdout:
+            self.lines.put(line.decode('utf-8', 'replace'))
+        self.ended = True
+        self.lines.put(None)
+
+    def __read_errors(self):
+        for line in self.process.stderr:
+            self.errors.append(line.decode('utf-8', 'replace'))
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, command):
+        # Raises BrokenPipeError or OSError if the command was not delivered.
+        request = f"{command}\nprintf '\\n%s %d\\n' {self.marker} \"$?\"\n"
+        self.process.stdin.write(request.encode())
+        self.process.stdin.flush()
+
+    def receive(self, timeout=None):
+        # Returns (exit code, output) of the command sent last.
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        output = []
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise RuntimeError(f"No response from {self.serial} in {timeout} s")
+            if line is None:
+                raise RuntimeError(f"Shell session to {self.serial} has ended")
+            if line.startswith(self.marker):
+                break
+            output.append(line)
+
+        text = "".join(output).replace("\r\n", "\n")
+        # The marker line is preceded by a newline of its own.
+        return int(line.split()[1]), text[:-1] if text.endswith("\n") else text
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.logger.debug("Closed shell session to %s", self.serial)
+
+
+class ShellSessionPool:
+    # Idle shell sessions per device. A command takes an idle session or
+    # opens a new one, so concurrent commands get sessions of their own.
+    # Dead sessions are replaced; a session that failed in the middle of a
+    # command is dropped, since its output can no longer be trusted.
+
+    def __init__(self, adb_path, timeout=10):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.adb_path = adb_path
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = dict()
+
+    def __acquire(self, serial):
+        with self.lock:
+            sessions = self.idle.setdefault(serial, [])
+            while sessions:
+                session = sessions.pop()
+                if session.alive():
+                    return session
+                session.close()
+        return ShellSession(self.adb_path, serial, self.timeout)
+
+    def __release(self, session):
+        with self.lock:
+            self.idle.setdefault(session.serial, []).append(session)
+
+    def run(self, serial, command, timeout=None):
+        # Returns (exit code, output) of a command line. timeout overrides
+        # the response timeout of the session for long commands. If no
+        # session can be opened the command is not sent: ShellSessionUnavailable
+        # is raised if the device does not support sessions, RuntimeError
+        # otherwise, and the next command tries to open one again.
+        session = self.__acquire(serial)
+        try:
+            session.send(command)
+        except OSError as exp:
+            # The command has not been delivered, so it is safe to resend it
+            # through a new session.
+            self.logger.warn("Shell session to %s is broken (%s), reconnecting", serial, exp)
+            session.close()
+            session = ShellSession(self.adb_path, serial, self.timeout)
+            try:
+                session.send(command)
+            except OSError as exp:
+                session.close()
+                raise RuntimeError(f"Cannot open shell session to {serial}: {exp}")
+
+        try:
+            result = session.receive(timeout)
+        except RuntimeError:
+            session.close()
+            raise
+        self.__release(session)
+        return result
+
+    def close(self):
+        with self.lock:
+            sessions = [session for sessions in self.idle.values() for session in sessions]
+            self.idle.clear()
+        for session in sessions:
+            session.close()
+
+
 class ADBConnector:
     __activityRecord = re.compile(r"^mResumedActivity:\s*ActivityRecord{\w+\s+\w+\s+(\S+)\s+\w+}$")
+    # RGBA_8888 and RGBX_8888, the formats screencap uses for raw frames
+    __rawFormats = (1, 2)
+    __captureModes = ('raw', 'png')
 
-    def __init__(self, retry_delay):
+    def __init__(self, retry_delay, adb_path="adb", capture='raw', sessions=True):
+        # capture is 'raw' to transfer uncompressed frames or 'png' to
+        # transfer them PNG-encoded; raw capture falls back to PNG if the
+        # device does not support it. With sessions set shell commands go
+        # through long-lived shell sessions instead of an adb process each,
+        # unless the device turns out not to support them.
+        if capture not in ADBConnector.__captureModes:
+            raise ValueError(f"Unknown capture mode: {capture}")
         self.logger = log.get_logger(log.class_fullname(self))
         self.retry_delay = retry_delay
+        self.adb_path = adb_path
+        self.capture = capture
+        self.shell_sessions = ShellSessionPool(adb_path) if sessions else None
 
-    @staticmethod
-    def device_list():
-        process = subprocess.Popen(["adb", "devices", "-l"], stdout=subprocess.PIPE, universal_newlines=True)
+    def close(self):
+        if self.shell_sessions is not None:
+            self.shell_sessions.close()
+
+    def shell(self, device, command, timeout=None):
+        # Runs a shell command line on the device; returns (exit code,
+        # output).
+        shell_sessions = self.shell_sessions
+        if shell_sessions is not None:
+            try:
+                return shell_sessions.run(device.serial, command, timeout)
+            except ShellSessionUnavailable as exp:
+                # The command has not been sent, so it is run once more by an
+                # adb process, as are all the commands after it.
+                self.logger.warn("%s, falling back to an adb process per command", exp)
+                self.shell_sessions = None
+                shell_sessions.close()
+        try:
+            adb = subprocess.run([self.adb_path, "-s", device.serial, "shell", command], stdout=subprocess.PIPE,
+                                 universal_newlines=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"No response from {device.serial} in {timeout} s")
+        return adb.returncode, adb.stdout
+
+    def device_list(self):
+        process = subprocess.Popen([self.adb_path, "devices", "-l"], stdout=subprocess.PIPE, universal_newlines=True)
         out, _ = process.communicate()
         if process.returncode != 0:
             raise RuntimeError(f"Non-zero exit code: {process.returncode}")
@@ -43,11 +251,7 @@ class ADBConnector:
 
     def check_if_screen_is_on(self, device):
         self.logger.debug("Checking if device screen is on")
-        adb = subprocess.Popen(["adb", "-s", device.serial, "shell",
-                                "dumpsys activity | grep 'mWakefulness'"], stdout=subprocess.PIPE,
-                                universal_newlines=True)
-        adb_output, _ = adb.communicate()
-        exit_code = adb.returncode
+        exit_code, adb_output = self.shell(device, "dumpsys activity | grep 'mWakefulness'")
 
         if exit_code != 0:
             self.logger.warn("Non-zero exit code %s", exit_code)
@@ -71,11 +275,11 @@ class ADBConnector:
 
 
     def check_activity(self, device, activity_re):
-        adb = subprocess.Popen(["adb", "-s", device.serial, "shell",
-                                "dumpsys activity a | grep -E 'mResumedActivity'"], stdout=subprocess.PIPE,
-                               universal_newlines=True)
-        adb_output, _ = adb.communicate()
-        exit_code = adb.returncode
+        try:
+            exit_code, adb_output = self.shell(device, "dumpsys activity a | grep -E 'mResumedActivity'")
+        except RuntimeError as exp:
+            self.logger.warn("Shell command failed: %s", exp)
+            return None
 
         if exit_code != 0:
             self.logger.warn("Non-zero exit code %s", exit_code)
@@ -107,10 +311,50 @@ class ADBConnector:
         return activity
 
     def take_screenshot(self, device):
-        # See https://stackoverflow.com/a/61629220
         self.logger.debug("Taking screenshot")
+        if self.capture == 'raw':
+            try:
+                return self.__take_raw_screenshot(device)
+            except RawCaptureUnsupported as exp:
+                self.logger.warn("Raw screen capture is not supported (%s), falling back to PNG", exp)
+                self.capture = 'png'
+            except RuntimeError as exp:
+                # E.g. a lost connection; the next frame is captured raw again.
+                self.logger.warn("Raw screen capture failed (%s), taking PNG this time", exp)
+        return self.__take_png_screenshot(device)
+
+    def __take_raw_screenshot(self, device):
+        # exec-out transfers the output as is, so the frame needs neither
+        # PNG encoding nor base64.
+        adb = subprocess.run([self.adb_path, "-s", device.serial, "exec-out", "screencap"], stdout=subprocess.PIPE)
+        if adb.returncode != 0:
+            raise RuntimeError(f"Non-zero exit code: {adb.returncode}")
+        return ADBConnector.decode_raw_frame(adb.stdout)
+
+    @staticmethod
+    def decode_raw_frame(data):
+        # The header is width, height and pixel format, followed by a color
+        # space on Android 9+; pixels are RGBA. Raises RawCaptureUnsupported
+        # for frames that cannot be decoded, RuntimeError for truncated ones.
+        if len(data) < 12:
+            raise RuntimeError(f"Truncated frame of {len(data)} bytes")
+        width, height, pixel_format = struct.unpack_from("<3I", data)
+        header_size = len(data) - width * height * 4
+        if header_size < 12:
+            raise RuntimeError(f"Truncated frame of {len(data)} bytes for size {width}x{height}")
+        if header_size not in (12, 16):
+            raise RawCaptureUnsupported(f"Frame of {len(data)} bytes does not match its size {width}x{height}")
+        if pixel_format not in ADBConnector.__rawFormats:
+            raise RawCaptureUnsupported(f"Unsupported pixel format: {pixel_format}")
+        pixels = np.frombuffer(data, dtype=np.uint8, offset=header_size).reshape(height, width, 4)
+        # A strided BGR view would be copied by every OpenCV call, so the
+        # frame is converted once.
+        return cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR)
+
+    def __take_png_screenshot(self, device):
+        # See https://stackoverflow.com/a/61629220
         # noinspection SpellCheckingInspection
-        adb = subprocess.Popen(["adb", "-s", device.serial, "shell",
+        adb = subprocess.Popen([self.adb_path, "-s", device.serial, "shell",
                                 "screencap -p | base64"], stdout=subprocess.PIPE)
         adb_output, _ = adb.communicate()
         png_screenshot_data = base64.b64decode(adb_output)
@@ -119,4 +363,32 @@ class ADBConnector:
 
     def tap(self, device, point):
         self.logger.debug("Tap at (%d, %d)", *point)
-        subprocess.run(["adb", "-s", device.serial, "shell", "input", "tap", str(point[0]), str(point[1])])
+        exit_code, _ = self.shell(device, f"input tap {point[0]} {point[1]}")
+        if exit_code != 0:
+            self.logger.warn("Non-zero exit code %s", exit_code)
+
+    def tap_sequence(self, device, points, delay, chunk_size=16, should_continue=None):
+        # Taps the points one after another with `delay` seconds after every
+        # tap. The taps and the delays run as a script on the device, one
+        # shell command per chunk of taps; before every chunk
+        # should_continue() decides whether to go on. Returns the number of
+        # taps made.
+        tapped = 0
+        while tapped < len(points):
+            if should_continue is not None and not should_continue():
+                self.logger.info("Tap sequence stopped after %d of %d taps", tapped, len(points))
+                break
+            chunk = points[tapped:tapped + chunk_size]
+            commands = []
+            for x, y in chunk:
+                commands.append(f"input tap {x} {y}")
+                if delay > 0:
+                    commands.append(f"sleep {delay:g}")
+            self.logger.debug("Tapping %d points", len(chunk))
+            # A single tap may take up to a second on slow devices.
+            timeout = self.retry_delay + len(chunk) * (delay + 1)
+            exit_code, _ = self.shell(device, " && ".join(commands), timeout)
+            if exit_code != 0:
+                raise RuntimeError(f"Tap sequence failed with exit code {exit_code}")
+            tapped += len(chunk)
+        return tapped
@@ -1,45 +1,35 @@
-class DisjointSetUnionWithBoundingRects:
-    def __init__(self, points):
-        self.points = points
-        self.rects = [(x, y, 0, 0) for x, y in points]
-        self.parents = list(range(len(points)))
-        self.weights = [1] * len(points)
+import bisect
+
+import numpy as np
+
+
+class DisjointSetUnion:
+    def __init__(self, size):
+        self.parents = list(range(size))
+        self.weights = [1] * size
 
     def union(self, i, j):
         i = self.find(i)
         j = self.find(j)
+        if i == j:
+            return i
         if self.weights[i] < self.weights[j]:
             i, j = j, i
 
         self.parents[j] = i
-        self.rects[i] = Geometry.combine_two_rects(self.rects[i], self.rects[j])
         self.weights[i] += self.weights[j]
 
         return i
 
     def find(self, i):
-        while self.parents[i] != i:
-            self.parents[i] = self.find(self.parents[i])
-            i = self.parents[i]
-
-        return i
+        root = i
+        while self.parents[root] != root:
+            root = self.parents[root]
 
-    def point(self, i):
-        return self.points[i]
+        while self.parents[i] != root:
+            self.parents[i], i = root, self.parents[i]
 
-    def bounding_rect(self, i):
-        return self.rects[self.find(i)]
-
-
-def listify(index_to_object, index_list):
-    list_of_objects = [None] * len(index_to_object)
-    index_to_pos = dict()
-
-    for pos, (index, obj) in enumerate(index_to_object.items()):
-        index_to_pos[index] = pos
-        list_of_objects[pos] = obj
-
-    return list_of_objects, list(map(lambda idx: index_to_pos[idx], index_list))
+        return root
 
 
 class Geometry:
@@ -73,15 +63,32 @@ class Geometry:
 
     @staticmethod
     def join_neighbours(rects, x_scale, y_scale):
-        arcs = []
+        # Arcs (i, j) between rects whose centers are close relative to
+        # their sizes, in order of i and then j. Rects are swept by the x of
+        # their centers: a neighbour of rect i is at most
+        # (width_i + max_width) * x_scale away along x, so only that window
+        # is checked exactly.
+        if not rects:
+            return []
+
+        centers = [Geometry.rectangle_center(rect) for rect in rects]
+        order = sorted(range(len(rects)), key=lambda i: centers[i][0])
+        sorted_x = [centers[i][0] for i in order]
+        max_width = max(Geometry.rect_width(rect) for rect in rects)
 
+        arcs = []
         for i, rect_i in enumerate(rects):
-            center_i = Geometry.rectangle_center(rect_i)
-            for j, rect_j in enumerate(rects):
+            center_i = centers[i]
+            reach = (Geometry.rect_width(rect_i) + max_width) * x_scale
+            low = bisect.bisect_left(sorted_x, center_i[0] - reach)
+            high = bisect.bisect_right(sorted_x, center_i[0] + reach)
+
+            for j in sorted(order[low:high]):
                 if i == j:
                     continue
 
-                center_j = Geometry.rectangle_center(rect_j)
+                rect_j = rects[j]
+                center_j = centers[j]
                 dx = abs(center_i[0] - center_j[0])
                 dy = abs(center_i[1] - center_j[1])
                 sum_width = Geometry.rect_width(rect_i) + Geometry.rect_width(rect_j)
@@ -94,29 +101,33 @@ class Geometry:
 
     @staticmethod
     def clusterize_rects(rects, x_scale, y_scale):
-        arcs = Geometry.join_neighbours(rects, x_scale, y_scale)
-
-        points = []
-        for x, y, w, h in rects:
-            points.append((x, y))
-            points.append((x, y + h))
-            points.append((x + w, y))
-            points.append((x + w, y + h))
-
-        dsu = DisjointSetUnionWithBoundingRects(points)
+        # Returns (cluster bounding rects, cluster index of every rect).
+        # Clusters are connected components of join_neighbours, numbered in
+        # order of their first rect.
+        if not rects:
+            return [], []
+
+        dsu = DisjointSetUnion(len(rects))
+        for i, j in Geometry.join_neighbours(rects, x_scale, y_scale):
+            dsu.union(i, j)
+
+        cluster_of_root = dict()
+        parent_link = []
         for i in range(len(rects)):
-            for delta in range(1, 4):
-                dsu.union(4 * i, 4 * i + delta)
-
-        for i, j in arcs:
-            dsu.union(4 * i, 4 * j)
-
-        unique_rects = dict()
-        parent_link = list()
-
-        for i in range(len(rects)):
-            parent = dsu.find(4 * i)
-            parent_link.append(parent)
-            unique_rects[parent] = dsu.bounding_rect(4 * i)
-
-        return listify(unique_rects, parent_link)
+            parent_link.append(cluster_of_root.setdefault(dsu.find(i), len(cluster_of_root)))
+
+        boxes = np.array(rects, dtype=np.int64).reshape(-1, 4)
+        labels = np.array(parent_link)
+        cluster_cnt = len(cluster_of_root)
+        min_x = np.full(cluster_cnt, np.iinfo(np.int64).max)
+        min_y = np.full(cluster_cnt, np.iinfo(np.int64).max)
+        max_x = np.full(cluster_cnt, np.iinfo(np.int64).min)
+        max_y = np.full(cluster_cnt, np.iinfo(np.int64).min)
+        np.minimum.at(min_x, labels, boxes[:, 0])
+        np.minimum.at(min_y, labels, boxes[:, 1])
+        np.maximum.at(max_x, labels, boxes[:, 0] + boxes[:, 2])
+        np.maximum.at(max_y, labels, boxes[:, 1] + boxes[:, 3])
+
+        clusters = [(int(x), int(y), int(right - x), int(bottom - y))
+                    for x, y, right, bottom in zip(min_x, min_y, max_x, max_y)]
+        return clusters, parent_link
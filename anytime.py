@@ -0,0 +1,139 @@
+import threading
+import time
+
+import log
+import logic
+import search
+
+
+"""
+Решение «в любой момент времени» (anytime).
+
+Сначала жадный поиск быстро находит какое-нибудь решение, затем взвешенный
+A* с уменьшающимися весами ищет решения короче лучшего найденного: узлы, у
+которых g + h не меньше стоимости лучшего решения, отсекаются. Поиск идёт в
+фоновом потоке, текущее лучшее решение доступно в любой момент через best.
+После прохода с весом 1 (обычный A* с отсечением) лучшее решение
+оптимально.
+"""
+
+
+class AnytimeSolver:
+    # Cost bounds rely on the admissible color change heuristic, so the
+    # heuristic is not configurable here.
+
+    def __init__(self, weights=(5, 3, 2, 1.5, 1), canonicalize=True, macro_moves=True, cache=None):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.weights = list(weights)
+        self.canonicalize = canonicalize
+        self.macro_moves = macro_moves
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.thread = None
+        self.cancelled = threading.Event()
+        self.improved = threading.Condition(self.lock)
+        self.best_solution = None
+        self.optimal = False
+        self.finished = False
+
+    @property
+    def best(self):
+        # The shortest solution found so far, or None.
+        with self.lock:
+            return self.best_solution
+
+    def start(self, initial_game, time_limit=None):
+        if self.thread is not None and self.thread.is_alive():
+            raise RuntimeError("Anytime solver is already running")
+        with self.lock:
+            self.best_solution = None
+            self.optimal = False
+            self.finished = False
+        self.cancelled.clear()
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        self.thread = threading.Thread(target=self.__run, args=(initial_game, deadline), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.cancelled.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def wait(self, timeout=None, first_only=False):
+        # Waits until the search finishes, or only until some solution is
+        # available if first_only is set. Returns the best solution so far.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            while not self.finished and not (first_only and self.best_solution is not None):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.improved.wait(remaining)
+            return self.best_solution
+
+    def solve(self, initial_game, time_limit, hard_time_limit=None):
+        # Returns the best solution found within time_limit. If there is no
+        # solution by then, waits for the first one up to hard_time_limit.
+        self.start(initial_game, hard_time_limit)
+        try:
+            solution = self.wait(time_limit)
+            if solution is None:
+                solution = self.wait(first_only=True)
+            return solution
+        finally:
+            self.stop()
+
+    def __run(self, initial_game, deadline):
+        cached = False
+        try:
+            if self.cache is not None:
+                solution = self.cache.get(initial_game)
+                if solution is not None:
+                    self.logger.info("Found cached solution")
+                    cached = True
+                    self.__improve(solution)
+                    return
+
+            self.__improve(self.__search(initial_game, search.GreedyBestFirst(), deadline))
+            for weight in self.weights:
+                if self.best_solution is None:
+                    break
+                solution = self.__search(initial_game, search.WeightedAStar(weight, len(self.best_solution) - 1),
+                                         deadline)
+                self.__improve(solution)
+                # Weighted passes close nodes with suboptimal costs and never
+                # reopen them, so only a plain A* pass proves optimality.
+                if weight <= 1:
+                    self.logger.info("Solution with %d moves is optimal", len(self.best_solution) - 1)
+                    self.optimal = True
+                    break
+        except logic.SearchAborted as exp:
+            self.logger.debug("Anytime search stopped: %s", exp)
+        except Exception as exp:
+            self.logger.error("Anytime search failed: %s", exp)
+        finally:
+            if self.cache is not None and self.best_solution is not None and not cached:
+                self.cache.put(initial_game, self.best_solution)
+            with self.lock:
+                self.finished = True
+                self.improved.notify_all()
+
+    def __search(self, initial_game, strategy, deadline):
+        solver = logic.Solver(strategy=strategy, canonicalize=self.canonicalize, macro_moves=self.macro_moves,
+                              time_limit=None if deadline is None else deadline - time.monotonic(),
+                              progress=self.__check_cancelled, progress_interval=0)
+        solution = solver.solve(initial_game)
+        self.logger.debug("%s: %s", strategy, solver.stats)
+        return solution
+
+    def __check_cancelled(self, stats):
+        if self.cancelled.is_set():
+            raise logic.SearchAborted('cancelled', "Search cancelled")
+
+    def __improve(self, solution):
+        with self.lock:
+            if solution is not None and (self.best_solution is None or len(solution) < len(self.best_solution)):
+                self.logger.info("Found solution with %d moves", len(solution) - 1)
+                self.best_solution = solution
+                self.improved.notify_all()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import collections
+import json
+import multiprocessing
+import sys
+import time
+
+import logic
+import search
+import solution_cache
+
+
+"""
+Пакетное решение уровней без телефона.
+
+На вход подаются конфигурации в формате Game.serialize_configuration
+(по одной на строку, например "ab;cd;ba;dc;;"), на выход -- JSON-строки с
+решениями в том же порядке. Уровни решаются в пуле процессов, при этом в
+работе одновременно находится не больше --in-flight уровней.
+"""
+
+
+solver = None
+
+
+def init_worker(solver_kwargs, cache_path):
+    global solver
+    if cache_path is not None:
+        solver_kwargs = dict(solver_kwargs, cache=solution_cache.SolutionCache(cache_path))
+    solver = logic.Solver(**solver_kwargs)
+
+
+def solve_line(index, line):
+    record = {'index': index, 'configuration': line}
+    start = time.monotonic()
+    try:
+        configuration = logic.Game.deserialize_configuration(line)
+        game = logic.Game(logic.Game.find_optimal_parameters(configuration), configuration)
+        if not game.is_valid():
+            raise ValueError("Invalid configuration")
+    except (ValueError, ZeroDivisionError) as exp:
+        record.update(status='invalid', error=str(exp))
+        return record
+
+    try:
+        solution = solver.solve(game)
+        if solution is None:
+            record['status'] = 'unsolvable'
+            if solver.stats.unsolvable is not None:
+                record['reason'] = solver.stats.unsolvable
+        else:
+            record.update(status='solved', moves=logic.Solver.moves_from_solution(solution))
+    except logic.SearchAborted as exp:
+        record.update(status='timeout' if exp.reason == 'time' else 'aborted', reason=exp.reason, error=str(exp))
+    except Exception as exp:
+        record.update(status='error', error=repr(exp))
+
+    record['stats'] = dict(solver.stats.as_dict(), wall_time=time.monotonic() - start)
+    return record
+
+
+def read_lines(stream):
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def solve_stream(lines, output, solver_kwargs, workers=None, in_flight=None, cache_path=None):
+    in_flight = in_flight or 4 * (workers or multiprocessing.cpu_count())
+    # The solver enforces the time limit itself; the hard limit only guards
+    # against a worker that is lost together with its result.
+    time_limit = solver_kwargs.get('time_limit')
+    hard_limit = None if time_limit is None else 2 * time_limit + 5
+
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(solver_kwargs, cache_path)) as pool:
+        pending = collections.deque()
+        for index, line in enumerate(lines):
+            pending.append((index, line, pool.apply_async(solve_line, (index, line))))
+            if len(pending) >= in_flight:
+                write_record(output, wait_for_record(*pending.popleft(), hard_limit))
+        while pending:
+            write_record(output, wait_for_record(*pending.popleft(), hard_limit))
+
+
+def wait_for_record(index, line, result, hard_limit):
+    try:
+        return result.get(hard_limit)
+    except multiprocessing.TimeoutError:
+        return {'index': index, 'configuration': line, 'status': 'timeout', 'error': "Worker did not respond"}
+
+
+def write_record(output, record):
+    output.write(json.dumps(record) + '\n')
+    output.flush()
+
+
+def make_strategy(args):
+    if args.strategy == 'wastar':
+        return search.WeightedAStar(args.weight)
+    if args.strategy == 'beam':
+        return search.BeamSearch(args.beam_width)
+    return search.STRATEGIES[args.strategy]()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve serialized configurations in batch")
+    parser.add_argument('input', nargs='?', default='-', help="file with one configuration per line, '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="JSON lines output file, '-' for stdout")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of solver processes")
+    parser.add_argument('--in-flight', type=int, default=None, help="maximum number of levels being solved")
+    parser.add_argument('--timeout', type=float, default=None, help="time limit per level in seconds")
+    parser.add_argument('--max-nodes', type=int, default=None, help="limit of expanded nodes per level")
+    parser.add_argument('--max-memory', type=int, default=None, help="memory limit of a solver process in MB")
+    parser.add_argument('--strategy', choices=sorted(search.STRATEGIES), default='greedy')
+    parser.add_argument('--weight', type=float, default=2, help="weight for --strategy wastar")
+    parser.add_argument('--beam-width', type=int, default=1000, help="width for --strategy beam")
+    parser.add_argument('--heuristic', choices=logic.SearchSpace.HEURISTICS, default='color_changes')
+    parser.add_argument('--no-canonicalize', action='store_true')
+    parser.add_argument('--no-macro-moves', action='store_true')
+    parser.add_argument('--cache', default=None, help="path to a solution cache database")
+    args = parser.parse_args()
+
+    solver_kwargs = dict(strategy=make_strategy(args), canonicalize=not args.no_canonicalize,
+                         macro_moves=not args.no_macro_moves, heuristic=args.heuristic, time_limit=args.timeout,
+                         max_nodes=args.max_nodes,
+                         max_memory=None if args.max_memory is None else args.max_memory << 20)
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        solve_stream(read_lines(source), output, solver_kwargs, workers=args.workers, in_flight=args.in_flight,
+                     cache_path=args.cache)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import heapq
+import json
+import multiprocessing
+import sys
+import time
+
+import levels
+import logic
+import search
+import vectorized
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+"""
+Бенчмарки решателя.
+
+  bench.py expansion -- скорость раскрытия узлов (узлов в секунду) для
+                        разных реализаций одного и того же жадного поиска;
+  bench.py suite     -- время, число раскрытых узлов, размер discovered,
+                        пиковая память и длина решения для набора
+                        конфигураций решателя на сгенерированных уровнях,
+                        со сравнением с сохранённым эталоном.
+"""
+
+
+# Every expander runs the same greedy best-first search and differs only in
+# how a node is expanded, so nodes/sec are directly comparable.
+
+def expand_game_api(game, max_nodes):
+    num_of_flasks = game.parameters.N + game.parameters.M
+    heap = [(game.priority(), 0, game)]
+    discovered = {game.configuration}
+    expanded = 0
+
+    while heap and expanded < max_nodes:
+        _, _, game = heapq.heappop(heap)
+        expanded += 1
+        if game.is_winning_configuration():
+            break
+        for i in range(num_of_flasks):
+            for j in range(num_of_flasks):
+                if game.can_do_a_move(i, j):
+                    new_game = game.do_a_move_unsafe(i, j)
+                    if new_game.configuration not in discovered:
+                        discovered.add(new_game.configuration)
+                        heapq.heappush(heap, (new_game.priority(), len(discovered), new_game))
+
+    return expanded
+
+
+def expand_rescan(game, max_nodes):
+    codec = logic.StateCodec(game.parameters, game.configuration)
+    state = codec.encode(game.configuration)
+    heap = [(codec.count_color_changes(state), 0, state)]
+    discovered = {state}
+    expanded = 0
+
+    while heap and expanded < max_nodes:
+        _, _, state = heapq.heappop(heap)
+        expanded += 1
+        if codec.is_winning_state(state):
+            break
+        for i, j, height_i, height_j in codec.moves(state):
+            new_state = codec.do_a_move(state, i, j, height_i, height_j)
+            if new_state not in discovered:
+                discovered.add(new_state)
+                heapq.heappush(heap, (codec.count_color_changes(new_state), len(discovered), new_state))
+
+    return expanded
+
+
+def expand_incremental(game, max_nodes):
+    codec = logic.StateCodec(game.parameters, game.configuration)
+    state = codec.encode(game.configuration)
+    heap = [(codec.count_color_changes(state), 0, state, codec.initial_meta(state))]
+    discovered = {state}
+    expanded = 0
+
+    while heap and expanded < max_nodes:
+        score, _, state, meta = heapq.heappop(heap)
+        expanded += 1
+        if codec.is_winning_meta(meta):
+            break
+        for _, _, new_state, new_meta, new_score in codec.children(state, meta, score):
+            if new_state not in discovered:
+                discovered.add(new_state)
+                heapq.heappush(heap, (new_score, len(discovered), new_state, new_meta))
+
+    return expanded
+
+
+EXPANDERS = {
+    'game-api': expand_game_api,
+    'rescan': expand_rescan,
+    'incremental': expand_incremental,
+}
+
+
+SOLVER_CONFIGURATIONS = {
+    'greedy': dict(strategy=search.GreedyBestFirst(), canonicalize=True),
+    'greedy-fullness': dict(strategy=search.GreedyBestFirst(), canonicalize=True, heuristic='flask_fullness'),
+    'wastar-2': dict(strategy=search.WeightedAStar(2), canonicalize=True),
+    'wastar-2-pdb': dict(strategy=search.WeightedAStar(2), canonicalize=True, heuristic='pattern_database'),
+    'beam-500': dict(strategy=search.BeamSearch(500), canonicalize=True),
+    # The vectorized beam search plays single-ball moves only.
+    'vbeam-500': dict(strategy=vectorized.VectorizedBeamSearch(500), canonicalize=True, macro_moves=False),
+    'adaptive': dict(strategy=search.AdaptiveStrategy(), canonicalize=True),
+}
+
+
+DEFAULT_SHAPES = [logic.GameParameters(7, 2, 4), logic.GameParameters(12, 2, 4), logic.GameParameters(14, 2, 5)]
+
+
+def parse_parameters(value):
+    return logic.GameParameters(*map(int, value.split(',')))
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+
+def run_case(name, level, game, time_limit):
+    solver = logic.Solver(time_limit=time_limit, **SOLVER_CONFIGURATIONS[name])
+    try:
+        solution = solver.solve(game)
+        status = 'unsolved' if solution is None else 'solved'
+    except logic.SearchAborted as exp:
+        solution = None
+        status = 'timeout' if exp.reason == 'time' else 'aborted'
+
+    stats = solver.stats
+    return {
+        'configuration': name,
+        'level': level,
+        'status': status,
+        'wall_time': stats.elapsed,
+        'expanded': stats.expanded,
+        'nodes_per_sec': stats.expanded / stats.elapsed if stats.elapsed > 0 else None,
+        'discovered': stats.discovered,
+        'duplicates': stats.duplicates,
+        'frontier_peak': stats.frontier_peak,
+        'peak_rss_mb': peak_rss_mb(),
+        'solution_length': None if solution is None else len(solution) - 1,
+    }
+
+
+def run_suite(shapes, seeds, names, time_limit):
+    cases = []
+    for parameters in shapes:
+        for seed in range(seeds):
+            level = f"{parameters.N},{parameters.M},{parameters.K}/{seed}"
+            game = levels.generate_level(parameters, seed)
+            cases.extend((name, level, game, time_limit) for name in names)
+
+    # A fresh process per case makes the peak RSS of every run independent.
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        return pool.starmap(run_case, cases, chunksize=1)
+
+
+def compare_with_baseline(records, baseline, tolerance):
+    # Node counts and solution lengths are deterministic, so they are
+    # compared exactly; wall time is allowed to drift by `tolerance`.
+    reference = {(record['configuration'], record['level']): record for record in baseline}
+    regressions = []
+
+    for record in records:
+        base = reference.get((record['configuration'], record['level']))
+        if base is None:
+            continue
+        case = f"{record['configuration']} {record['level']}"
+        if base['status'] == 'solved' and record['status'] != 'solved':
+            regressions.append(f"{case}: {record['status']} (was solved)")
+            continue
+        if record['expanded'] > base['expanded']:
+            regressions.append(f"{case}: expanded {record['expanded']} (was {base['expanded']})")
+        if (record['solution_length'] is not None and base['solution_length'] is not None
+                and record['solution_length'] > base['solution_length']):
+            regressions.append(f"{case}: solution length {record['solution_length']} "
+                               f"(was {base['solution_length']})")
+        if record['wall_time'] > base['wall_time'] * (1 + tolerance) + 0.005:
+            regressions.append(f"{case}: wall time {record['wall_time']:.3f}s (was {base['wall_time']:.3f}s)")
+
+    return regressions
+
+
+def print_records(records):
+    print(f"{'configuration':<16}{'level':<14}{'status':<10}{'time, s':>9}{'expanded':>10}{'nodes/s':>10}"
+          f"{'discovered':>12}{'rss, MB':>9}{'length':>8}")
+    for record in records:
+        nodes_per_sec = record['nodes_per_sec']
+        rss = record['peak_rss_mb']
+        length = record['solution_length']
+        print(f"{record['configuration']:<16}{record['level']:<14}{record['status']:<10}"
+              f"{record['wall_time']:>9.3f}{record['expanded']:>10}"
+              f"{'-' if nodes_per_sec is None else f'{nodes_per_sec:.0f}':>10}{record['discovered']:>12}"
+              f"{'-' if rss is None else f'{rss:.1f}':>9}{'-' if length is None else length:>8}")
+
+
+def expansion_main(args):
+    for parameters in args.level or DEFAULT_SHAPES:
+        for name, expander in EXPANDERS.items():
+            total_nodes = 0
+            total_time = 0.0
+            for seed in range(args.seeds):
+                game = levels.generate_level(parameters, seed)
+                start = time.perf_counter()
+                total_nodes += expander(game, args.max_nodes)
+                total_time += time.perf_counter() - start
+            print(f"N={parameters.N} M={parameters.M} K={parameters.K}\t{name:<12}\t"
+                  f"{total_nodes:>8} nodes\t{total_nodes / total_time:>10.0f} nodes/sec")
+
+
+def suite_main(args):
+    records = run_suite(args.level or DEFAULT_SHAPES, args.seeds, args.configuration or list(SOLVER_CONFIGURATIONS),
+                        args.time_limit)
+    print_records(records)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(records, baseline_file, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_with_baseline(records, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solver benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    expansion = subparsers.add_parser('expansion', help="node expansion microbenchmark")
+    expansion.add_argument('--max-nodes', type=int, default=20000)
+    expansion.set_defaults(handler=expansion_main)
+
+    suite = subparsers.add_parser('suite', help="solver benchmark suite")
+    suite.add_argument('--configuration', choices=list(SOLVER_CONFIGURATIONS), action='append',
+                       help="solver configuration to run (may be repeated, default: all)")
+    suite.add_argument('--time-limit', type=float, default=60)
+    suite.add_argument('--baseline', default=None, help="JSON file with baseline results to compare with")
+    suite.add_argument('--save-baseline', default=None, help="write results to this JSON file")
+    suite.add_argument('--tolerance', type=float, default=0.25, help="allowed relative wall time regression")
+    suite.set_defaults(handler=suite_main)
+
+    for subparser in (expansion, suite):
+        subparser.add_argument('--level', type=parse_parameters, action='append',
+                               help="level shape as N,M,K (may be repeated)")
+        subparser.add_argument('--seeds', type=int, default=3)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
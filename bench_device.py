@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import adb_tools
+import gui
+import levels
+import logic
+
+
+"""
+Бенчмарки работы с экраном устройства.
+
+  bench_device.py preprocess -- время обработки одного кадра и пиковый объём
+                                выделенной памяти (по tracemalloc) для
+                                прежней предобработки скриншота и для
+                                gui.FramePreprocessor с разными масштабами;
+  bench_device.py capture    -- время снятия скриншота через PNG и через
+                                сырой кадр; по умолчанию вместо устройства
+                                используется fake_adb.py;
+  bench_device.py shell      -- задержка команд check_activity и tap с
+                                отдельным процессом adb на команду и через
+                                постоянные сессии adb shell.
+"""
+
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_adb.py')
+
+
+PALETTE = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (0, 255, 255), (255, 0, 255), (255, 255, 0), (0, 128, 255),
+           (255, 128, 0), (128, 0, 255), (200, 200, 200), (0, 200, 100), (160, 60, 250), (150, 150, 0),
+           (40, 180, 120)]
+
+
+def render_level(game, width=1080, height=2400):
+    # A synthetic screenshot: balls are colored circles with the glyph drawn
+    # on them, flasks are laid out in one or two rows.
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    configuration = game.configuration
+    flask_cnt = len(configuration)
+    rows = 2 if flask_cnt > 8 else 1
+    per_row = (flask_cnt + rows - 1) // rows
+    for flask_id, flask in enumerate(configuration):
+        row, column = divmod(flask_id, per_row)
+        in_row = per_row if row < rows - 1 else flask_cnt - per_row * (rows - 1)
+        x = int(width / 2 + (column - (in_row - 1) / 2) * 130)
+        bottom = int(height * 0.4) + row * int(height * 0.3)
+        for k, ball in enumerate(flask):
+            center = (x, bottom - 90 * k)
+            cv2.circle(image, center, 40, PALETTE[(ord(ball) - ord('A')) % len(PALETTE)], -1)
+            cv2.putText(image, ball, (center[0] - 15, center[1] + 15), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 3)
+    return image
+
+
+def preprocess_reference(image):
+    # Preprocessing as it was before gui.FramePreprocessor: four
+    # full-resolution thresholds stacked and reduced, header and footer cut
+    # afterwards.
+    thresholds = [cv2.threshold(image[:, :, i], 100, 255, cv2.THRESH_BINARY)[1] for i in range(image.shape[-1])]
+    grayscale = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    thresholds.append(cv2.threshold(grayscale, 100, 255, cv2.THRESH_BINARY)[1])
+    threshold = np.max(np.array(thresholds), axis=0)
+    header_height = int(image.shape[0] / 10)
+    footer_height = int(image.shape[0] / 10)
+    threshold[:header_height] = 0
+    threshold[-footer_height:] = 0
+    items = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = items[0] if len(items) == 2 else items[1]
+    return threshold, contours, [cv2.boundingRect(contour) for contour in contours]
+
+
+def measure(function, image, repeat):
+    function(image)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(image)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    function(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def preprocess_main(args):
+    if args.image is not None:
+        image = cv2.imread(args.image, cv2.IMREAD_COLOR)
+        if image is None:
+            raise RuntimeError(f"Cannot read {args.image}")
+    else:
+        image = render_level(levels.generate_level(args.level, 0))
+
+    _, _, reference_rects = preprocess_reference(image)
+    candidates = [('reference', preprocess_reference)]
+    for scale in args.scale or [1, 2]:
+        candidates.append((f"scale {scale}", gui.FramePreprocessor(scale).detect))
+
+    print(f"Frame {image.shape[1]}x{image.shape[0]}, {len(reference_rects)} objects")
+    for name, function in candidates:
+        elapsed, peak = measure(function, image, args.repeat)
+        same = sorted(function(image)[2]) == sorted(reference_rects)
+        print(f"{name:<12}{elapsed * 1e3:>9.2f} ms/frame{peak / (1 << 20):>9.2f} MB peak"
+              f"{'' if same else '  (rects differ from reference)'}")
+
+
+def capture_main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        if args.adb == FAKE_ADB and 'FAKE_ADB_SCREEN' not in os.environ:
+            os.environ['FAKE_ADB_SCREEN'] = os.path.join(directory, 'screen.png')
+            cv2.imwrite(os.environ['FAKE_ADB_SCREEN'], render_level(levels.generate_level(args.level, 0)))
+
+        images = dict()
+        for capture in ('png', 'raw'):
+            connector = adb_tools.ADBConnector(retry_delay=1, adb_path=args.adb, capture=capture)
+            device = connector.device_list()[0]
+            elapsed, _ = measure(lambda _: connector.take_screenshot(device), None, args.repeat)
+            images[capture] = connector.take_screenshot(device)
+            print(f"{capture:<6}{elapsed * 1e3:>9.1f} ms/frame")
+
+        if not np.array_equal(images['png'], images['raw']):
+            print("Raw and PNG frames differ")
+
+
+def shell_main(args):
+    activity = re.compile(r"^.*$")
+    for sessions in (False, True):
+        connector = adb_tools.ADBConnector(retry_delay=1, adb_path=args.adb, sessions=sessions)
+        device = connector.device_list()[0]
+        commands = [('check_activity', lambda _: connector.check_activity(device, activity)),
+                    ('tap', lambda _: connector.tap(device, (0, 0)))]
+        for name, command in commands:
+            elapsed, _ = measure(command, None, args.repeat)
+            print(f"{'sessions' if sessions else 'processes':<11}{name:<16}{elapsed * 1e3:>9.2f} ms/command")
+        connector.close()
+
+
+def parse_parameters(value):
+    return logic.GameParameters(*map(int, value.split(',')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Device screen benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    preprocess = subparsers.add_parser('preprocess', help="screenshot preprocessing benchmark")
+    preprocess.add_argument('--image', default=None, help="screenshot to process (default: a synthetic one)")
+    preprocess.add_argument('--level', type=parse_parameters, default=logic.GameParameters(14, 2, 4),
+                            help="shape N,M,K of the synthetic level")
+    preprocess.add_argument('--scale', type=int, action='append', help="downscale factor (may be repeated)")
+    preprocess.add_argument('--repeat', type=int, default=20)
+    preprocess.set_defaults(handler=preprocess_main)
+
+    capture = subparsers.add_parser('capture', help="screenshot capture benchmark")
+    capture.add_argument('--adb', default=FAKE_ADB, help="adb executable (default: fake_adb.py)")
+    capture.add_argument('--level', type=parse_parameters, default=logic.GameParameters(14, 2, 4),
+                         help="shape N,M,K of the level shown by the fake adb")
+    capture.add_argument('--repeat', type=int, default=10)
+    capture.set_defaults(handler=capture_main)
+
+    shell = subparsers.add_parser('shell', help="shell command latency benchmark")
+    shell.add_argument('--adb', default=FAKE_ADB, help="adb executable (default: fake_adb.py)")
+    shell.add_argument('--repeat', type=int, default=50)
+    shell.set_defaults(handler=shell_main)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import base64
+import os
+import re
+import struct
+import sys
+import time
+
+
+"""
+Заглушка adb для проверки и бенчмарков без устройства.
+
+Понимает те команды, которые отправляет adb_tools.ADBConnector, и
+изображает одно устройство FAKE0001 с открытой игрой. Скриншот берётся из
+записанного кадра -- PNG-файла из переменной окружения FAKE_ADB_SCREEN; для
+exec-out screencap он один раз переводится в сырой формат RGBA и
+сохраняется рядом с расширением .raw. FAKE_ADB_HEADER задаёт размер
+заголовка сырого кадра (12 или 16 байт, по умолчанию 16), FAKE_ADB_LOG --
+файл, в который записываются нажатия; sleep между нажатиями выполняется
+по-настоящему. Интерактивный adb shell (без команды) читает команды со
+стандартного ввода и понимает строку printf, которой
+adb_tools.ShellSession отмечает конец ответа.
+Использование:
+    ADBConnector(retry_delay, adb_path="./fake_adb.py")
+"""
+
+
+SERIAL = "FAKE0001"
+RESUMED_ACTIVITY = "com.spicags.ballsort/com.unity3d.player.UnityPlayerActivity"
+END_MARKER = re.compile(r"""^printf '\\n%s %d\\n' (\S+) "\$\?"$""")
+
+
+def screen_path():
+    path = os.environ.get("FAKE_ADB_SCREEN")
+    if path is None:
+        raise RuntimeError("FAKE_ADB_SCREEN is not set")
+    return path
+
+
+def png_frame():
+    with open(screen_path(), 'rb') as screen:
+        return screen.read()
+
+
+def raw_frame():
+    path = screen_path()
+    header_size = int(os.environ.get("FAKE_ADB_HEADER", "16"))
+    cache_path = f"{path}.{header_size}.raw"
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+        # OpenCV is imported only to convert a new frame, so that serving a
+        # converted one costs no more than a real adb client.
+        import cv2
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise RuntimeError(f"Cannot read {path}")
+        height, width = image.shape[:2]
+        header = struct.pack("<3I", width, height, 1)
+        if header_size == 16:
+            header += struct.pack("<I", 0)
+        with open(cache_path + '.tmp', 'wb') as output:
+            output.write(header)
+            output.write(cv2.cvtColor(image, cv2.COLOR_BGR2RGBA).tobytes())
+        os.replace(cache_path + '.tmp', cache_path)
+    with open(cache_path, 'rb') as frame:
+        return frame.read()
+
+
+def shell(command):
+    # Returns the output of a shell command line; commands joined with &&
+    # run one after another.
+    if '&&' in command:
+        return b"".join(shell(part.strip()) for part in command.split('&&'))
+    if command == "screencap -p | base64":
+        return base64.encodebytes(png_frame())
+    if command.startswith("dumpsys activity a"):
+        return f"    mResumedActivity: ActivityRecord{{f00d u0 {RESUMED_ACTIVITY} t42}}\n".encode()
+    if command.startswith("dumpsys activity"):
+        return b"  mWakefulness=Awake\n"
+    tokens = command.split()
+    if tokens[:1] == ["sleep"]:
+        time.sleep(float(tokens[1]))
+        return b""
+    if tokens[:2] == ["input", "tap"]:
+        log_path = os.environ.get("FAKE_ADB_LOG")
+        if log_path is not None:
+            with open(log_path, 'a') as log_file:
+                log_file.write(f"tap {tokens[2]} {tokens[3]}\n")
+        return b""
+    raise RuntimeError(f"Unsupported shell command: {command}")
+
+
+def interactive_shell():
+    status = 0
+    for line in sys.stdin:
+        command = line.strip()
+        if not command:
+            continue
+        m = END_MARKER.match(command)
+        if m is not None:
+            output = f"\n{m.group(1)} {status}\n".encode()
+        else:
+            try:
+                output = shell(command)
+                status = 0
+            except RuntimeError as exp:
+                sys.stderr.write(f"{exp}\n")
+                output = b""
+                status = 127
+        sys.stdout.buffer.write(output)
+        sys.stdout.buffer.flush()
+    return 0
+
+
+def main(argv):
+    if argv[:1] == ["-s"]:
+        if argv[1] != SERIAL:
+            sys.stderr.write(f"adb: device '{argv[1]}' not found\n")
+            return 1
+        argv = argv[2:]
+
+    if argv[:1] == ["devices"]:
+        output = f"List of devices attached\n{SERIAL}\tdevice product:fake model:Fake device:fake transport_id:1\n\n"
+        output = output.encode()
+    elif argv == ["exec-out", "screencap"]:
+        output = raw_frame()
+    elif argv == ["exec-out", "screencap", "-p"]:
+        output = png_frame()
+    elif argv in (["shell"], ["shell", "-T"]):
+        return interactive_shell()
+    elif argv[:1] == ["shell"]:
+        output = shell(" ".join(argv[1:]))
+    else:
+        sys.stderr.write(f"fake adb: unsupported command: {' '.join(argv)}\n")
+        return 1
+
+    sys.stdout.buffer.write(output)
+    sys.stdout.buffer.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
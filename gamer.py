@@ -1,10 +1,14 @@
 import re
+import threading
 import time
 
 import adb_tools
+import anytime
+import glyph_cache
 import gui
 import log
-import logic
+import optimizer
+import solution_cache
 import ui_tools
 
 
@@ -19,7 +23,23 @@ class Gamer:
         self.selected_device = None
         self.wait_delay = 0.05
         self.retry_delay = 4
-        self.solver = logic.Solver()
+        # The solver keeps shortening the solution for level_time_budget
+        # seconds; past that the first solution found is played, unless
+        # there is none within solve_time_limit.
+        self.level_time_budget = 2
+        self.solve_time_limit = 60
+        self.solver = anytime.AnytimeSolver(cache=solution_cache.SolutionCache("solutions.sqlite"))
+        self.optimizer = optimizer.SolutionOptimizer()
+        self.glyph_cache = glyph_cache.GlyphCache("glyphs.sqlite")
+        # 'ocr' or 'color', see gui.GUIConnector.
+        self.recognition = 'ocr'
+        # Kept across levels, so that flask layouts are remembered.
+        self.gui_connector = None
+        # With batched_playback the taps of a level are sent to the device as
+        # a few scripts, while the game activity is checked in the background
+        # every activity_check_interval seconds.
+        self.batched_playback = True
+        self.activity_check_interval = 1
 
         self.logger.info("Initializing Gamer instance")
         self.select_device()
@@ -65,27 +85,65 @@ class Gamer:
             steps.append(dst)
         return steps
 
+    def __play_batched(self, gui_connector, steps):
+        game_closed = threading.Event()
+        finished = threading.Event()
+
+        def watch_activity():
+            while not finished.wait(self.activity_check_interval):
+                if self.adb_connector.check_activity(self.selected_device, Gamer.__gameActivity) is None:
+                    game_closed.set()
+                    return
+
+        watcher = threading.Thread(target=watch_activity, daemon=True)
+        watcher.start()
+        try:
+            tapped = gui_connector.do_actions(steps, self.wait_delay, lambda: not game_closed.is_set())
+        finally:
+            finished.set()
+            watcher.join()
+        if tapped < len(steps):
+            raise RuntimeError("Game is closed")
+
     def pass_level(self):
         while self.adb_connector.check_activity(self.selected_device, Gamer.__gameActivity) is None:
             self.try_close_ad()
 
-        gui_connector = gui.GUIConnector(self.adb_connector, self.selected_device)
+        if self.gui_connector is None:
+            self.gui_connector = gui.GUIConnector(self.adb_connector, self.selected_device, self.glyph_cache,
+                                                  self.recognition)
+        gui_connector = self.gui_connector
         self.logger.debug("Trying to recognize screen")
 
         try:
             game = gui_connector.read_game()
             self.logger.info("Screen recognized, configuration: %s", repr(game))
-            solution = self.solver.solve(game)
+            reason = game.unsolvability_reason()
+            if reason is not None:
+                # Most likely the screen was misread, so it is read again.
+                raise RuntimeError(f"Unsolvable configuration: {reason}")
+            solution = self.solver.solve(game, self.level_time_budget, self.solve_time_limit)
+            if solution is None:
+                raise RuntimeError("No solution found")
+            # The level is solvable, so the glyphs were read right.
+            gui_connector.accept_recognition()
+            solution = self.optimizer.optimize(game, solution)
             self.logger.info("Solution found, %d moves, starting play", len(solution) - 1)
             steps = Gamer.__transform_to_steps(solution)
-            for step in steps:
-                if self.adb_connector.check_activity(self.selected_device, Gamer.__gameActivity) is None:
-                    raise RuntimeError("Game is closed")
-                gui_connector.do_action(step)
-                time.sleep(self.wait_delay)
+            if self.batched_playback:
+                self.__play_batched(gui_connector, steps)
+            else:
+                for step in steps:
+                    if self.adb_connector.check_activity(self.selected_device, Gamer.__gameActivity) is None:
+                        raise RuntimeError("Game is closed")
+                    gui_connector.do_action(step)
+                    time.sleep(self.wait_delay)
             self.logger.info("Level passed")
         except Exception as exp:
             self.logger.error("Exception: %s", exp)
+            # The screen may have been misread, so the new glyphs are not
+            # remembered and the next attempt scans it from scratch.
+            gui_connector.reject_recognition()
             raise exp
 
     def run(self):
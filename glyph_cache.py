@@ -0,0 +1,135 @@
+import os
+import sqlite3
+
+import cv2
+import numpy as np
+
+import log
+
+
+"""
+Кэш распознанных символов на шариках.
+
+На всех уровнях встречается один и тот же небольшой набор символов, поэтому
+Tesseract нужен только для символов, которые ещё не встречались. Вырезанный
+по ограничивающему прямоугольнику бинарный фрагмент шарика нормализуется:
+масштабируется до HASH_SIZE x HASH_SIZE и бинаризуется; биты этого образа
+вместе с округлённым отношением сторон образуют перцептивный хеш. Символ
+ищется сначала по точному совпадению хеша, затем среди известных хешей с тем
+же отношением сторон на расстоянии Хэмминга не больше max_distance.
+Новые метки от Tesseract сначала только предварительные: они сохраняются в
+SQLite и переживают перезапуск лишь после commit(), когда распознанный
+уровень подтвердился; rollback() забывает их, если распознавание оказалось
+ошибочным. Хеши, найденные по близкому совпадению, запоминаются только в
+памяти и тоже забываются при rollback(); с near=False get() доверяет лишь
+точному совпадению, и такие символы снова читает Tesseract.
+"""
+
+
+HASH_SIZE = 16
+
+
+class GlyphCache:
+    def __init__(self, path, max_distance=12):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.path = path
+        self.max_distance = max_distance
+        self.connection = None
+        self.labels = None
+        self.tentative = dict()
+        self.matched = dict()
+        self.pending = []
+
+    @staticmethod
+    def patch_hash(patch):
+        # `patch` is a binary image of a single glyph; returns (aspect bucket,
+        # hash bits as an int).
+        height, width = patch.shape[:2]
+        aspect = round(4 * width / height) if height > 0 else 0
+        normalized = cv2.resize(patch, (HASH_SIZE, HASH_SIZE), interpolation=cv2.INTER_AREA)
+        bits = np.packbits(normalized.reshape(-1) >= 128)
+        return aspect, int.from_bytes(bits.tobytes(), 'big')
+
+    def __connect(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS glyphs ("
+                                    "aspect INTEGER NOT NULL, bits TEXT NOT NULL, label TEXT NOT NULL, "
+                                    "PRIMARY KEY (aspect, bits))")
+            self.connection.commit()
+        return self.connection
+
+    def __load(self):
+        if self.labels is None:
+            rows = self.__connect().execute("SELECT aspect, bits, label FROM glyphs").fetchall()
+            self.labels = {(aspect, int(bits, 16)): label for aspect, bits, label in rows}
+            self.logger.debug("Loaded %d known glyphs", len(self.labels))
+        return self.labels
+
+    def close(self):
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def get(self, patch, near=True):
+        # Returns the label of a known glyph or None. Tentative labels are
+        # known too; with near unset only exact hash hits are returned.
+        key = GlyphCache.patch_hash(patch)
+        labels = self.__load()
+        label = labels.get(key) or self.tentative.get(key)
+        if label is not None or not near:
+            return label
+        label = self.matched.get(key)
+        if label is not None:
+            return label
+
+        aspect, bits = key
+        best_distance = self.max_distance + 1
+        for known_labels in (labels, self.tentative):
+            for (known_aspect, known_bits), known_label in known_labels.items():
+                if known_aspect != aspect:
+                    continue
+                distance = bin(bits ^ known_bits).count('1')
+                if distance < best_distance:
+                    best_distance = distance
+                    label = known_label
+
+        if label is not None:
+            # Remembering the exact hash makes the next lookup a dict hit.
+            self.matched[key] = label
+        return label
+
+    def put(self, patch, label):
+        # Remembers a tentative label; empty labels are never cached.
+        if label:
+            self.tentative[GlyphCache.patch_hash(patch)] = label
+
+    def commit(self):
+        # Makes the tentative labels permanent.
+        labels = self.__load()
+        for key, label in self.tentative.items():
+            labels[key] = label
+            self.pending.append((key[0], format(key[1], 'x'), label))
+        self.tentative.clear()
+        self.flush()
+
+    def rollback(self):
+        # Forgets the tentative labels and the near matches.
+        if self.tentative or self.matched:
+            self.logger.debug("Dropping %d tentative glyphs and %d near matches", len(self.tentative),
+                              len(self.matched))
+        self.tentative.clear()
+        self.matched.clear()
+
+    def flush(self):
+        if not self.pending:
+            return
+        connection = self.__connect()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO glyphs (aspect, bits, label) VALUES (?, ?, ?)",
+                                   self.pending)
+        self.pending = []
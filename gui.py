@@ -1,3 +1,5 @@
+import os
+import string
 from concurrent.futures import ThreadPoolExecutor
 
 import cv2
@@ -11,87 +13,228 @@ import logic
 
 class GUIConnector:
     __pytesseractConfig = r'-l eng --oem 3 --psm 10 -c tessedit_char_whitelist="0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ" '
+    __pytesseractMosaicConfig = \
+        r'-l eng --oem 3 --psm 6 -c tessedit_char_whitelist="0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ" '
+    __glyphAlphabet = string.digits + string.ascii_uppercase
+    __colorLabels = string.ascii_uppercase + string.digits
+    __hueBins = 12
+    __recognitionModes = ('ocr', 'color')
 
-    def __init__(self, adb_connector, device):
+    def __init__(self, adb_connector, device, glyph_cache=None, recognition='ocr', ocr_workers=None,
+                 ocr_mosaic=False, preprocess_scale=1):
+        # recognition is 'ocr' to read the glyphs on the balls with Tesseract
+        # or 'color' to tell balls apart by color only. OCR runs up to
+        # ocr_workers Tesseract processes at once (default: one per core), or
+        # a single one on a mosaic of all glyphs if ocr_mosaic is set. Balls
+        # are looked for on the screen downscaled preprocess_scale times.
+        if recognition not in GUIConnector.__recognitionModes:
+            raise ValueError(f"Unknown recognition mode: {recognition}")
         self.logger = log.get_logger(log.class_fullname(self))
         self.adb_connector = adb_connector
         self.device = device
+        self.glyph_cache = glyph_cache
+        # Cleared after a wrong read, so that glyphs known only by a near
+        # match are read by Tesseract again.
+        self.near_glyphs = True
+        self.recognition = recognition
+        self.ocr_workers = ocr_workers or os.cpu_count() or 1
+        self.ocr_mosaic = ocr_mosaic
+        self.preprocessor = FramePreprocessor(preprocess_scale)
         self.flask_coordinates = []
+        # Known flask layouts keyed by (screen shape, flask count), the most
+        # recently used last.
+        self.layouts = dict()
 
-    @staticmethod
-    def __threshold(grayscale_image, thresh=100):
-        return cv2.threshold(grayscale_image, thresh, 255, cv2.THRESH_BINARY)[1]
+    def __recognize_glyphs(self, thresh, rectangles):
+        # Recognizes tightly cropped, padded patches instead of full-screen
+        # images, in a pool of ocr_workers Tesseract processes or as a
+        # single mosaic. Glyphs are returned in the order of rectangles.
+        # Only the crops are inverted, not the whole frame.
+        crops = [255 - thresh[y:y + h, x:x + w] for x, y, w, h in rectangles]
 
-    @staticmethod
-    def __grayscale(image):
-        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        glyphs = [None] * len(crops)
+        if self.glyph_cache is not None:
+            glyphs = [self.glyph_cache.get(crop, self.near_glyphs) for crop in crops]
+
+        unknown = [i for i, glyph in enumerate(glyphs) if glyph is None]
+        if unknown:
+            patches = [GUIConnector.__pad(crops[i]) for i in unknown]
+            if self.ocr_mosaic:
+                recognized = self.__recognize_mosaic(patches)
+            else:
+                recognized = self.__recognize_patches(patches)
+            for i, txt in zip(unknown, recognized):
+                glyphs[i] = txt
+                # Until the level is confirmed, see accept_recognition(), the
+                # cached labels are tentative.
+                if self.glyph_cache is not None and GUIConnector.__is_glyph(txt):
+                    self.glyph_cache.put(crops[i], txt)
+            self.logger.debug("Recognized %d unknown glyphs of %d", len(unknown), len(crops))
+
+        for txt, (x, y, w, h) in zip(glyphs, rectangles):
+            self.logger.debug("Found %s at %dx%d+%d+%d", repr(txt), w, h, x, y)
+        return glyphs
 
     @staticmethod
-    def __preprocess(image):
-        thresholds = []
-        for i in range(image.shape[-1]):
-            thresholds.append(GUIConnector.__threshold(image[:, :, i]))
-        grayscale = GUIConnector.__grayscale(image)
-        thresholds.append(GUIConnector.__threshold(grayscale))
-
-        threshold = np.max(np.array(thresholds), axis=0)
-        # flask_borders = GUIConnector.__threshold(cv2.blur(GUIConnector.__threshold(grayscale, 225), (5, 5)), 1)
-        # threshold = np.bitwise_and(threshold, np.bitwise_not(flask_borders))
-
-        # Cut header and footer
-        img_height = image.shape[0]
-        header_height = int(img_height / 10)
-        footer_height = int(img_height / 10)
-        threshold[:header_height] = 0
-        threshold[-footer_height:] = 0
-
-        return threshold
+    def __is_glyph(txt):
+        return len(txt) > 0 and all(c in GUIConnector.__glyphAlphabet for c in txt)
 
     @staticmethod
-    def __find_objects(image):
-        items = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = items[0] if len(items) == 2 else items[1]
-        return contours
+    def __pad(patch):
+        # Tesseract needs a margin around a glyph to recognize it.
+        margin = max(patch.shape[:2]) // 2 + 1
+        return cv2.copyMakeBorder(patch, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value=255)
 
     @staticmethod
-    def __get_bounding_rectangles(contours):
-        return [cv2.boundingRect(contour) for contour in contours]
+    def __recognize_patch(patch):
+        return tess.image_to_string(patch, config=GUIConnector.__pytesseractConfig).strip()
 
-    def __recognize_glyphs(self, thresh, contours, rectangles):
-        inv_thresh = np.bitwise_not(thresh)
-        base = np.full(inv_thresh.shape, 255, dtype=thresh.dtype)
+    def __recognize_patches(self, patches):
+        # Every call runs a separate Tesseract process, so threads are enough
+        # to keep ocr_workers cores busy.
+        if self.ocr_workers == 1 or len(patches) == 1:
+            return [GUIConnector.__recognize_patch(patch) for patch in patches]
+        with ThreadPoolExecutor(max_workers=self.ocr_workers) as executor:
+            return list(executor.map(GUIConnector.__recognize_patch, patches))
 
-        glyphs = []
+    def __recognize_mosaic(self, patches):
+        # Patches are tiled into a grid of equal cells and recognized in one
+        # call; every character box is mapped back to its cell by its center.
+        # Cells which did not get exactly one character are recognized one by
+        # one.
+        cell_height = max(patch.shape[0] for patch in patches)
+        cell_width = max(patch.shape[1] for patch in patches)
+        columns = int(np.ceil(np.sqrt(len(patches))))
+        rows = (len(patches) + columns - 1) // columns
+        mosaic = np.full((rows * cell_height, columns * cell_width), 255, dtype=np.uint8)
+        for i, patch in enumerate(patches):
+            row, column = divmod(i, columns)
+            y = row * cell_height + (cell_height - patch.shape[0]) // 2
+            x = column * cell_width + (cell_width - patch.shape[1]) // 2
+            mosaic[y:y + patch.shape[0], x:x + patch.shape[1]] = patch
 
-        for contour, (x, y, w, h) in zip(contours, rectangles):
-            base[y:y + h, x:x + w] = inv_thresh[y:y + h, x:x + w]
-            txt = tess.image_to_string(base, config=GUIConnector.__pytesseractConfig).strip()
-            self.logger.debug("Found %s at %dx%d+%d+%d", repr(txt), w, h, x, y)
-            glyphs.append(txt)
-            base[y:y + h, x:x + w] = 255
+        found = [[] for _ in patches]
+        boxes = tess.image_to_boxes(mosaic, config=GUIConnector.__pytesseractMosaicConfig)
+        for line in boxes.splitlines():
+            tokens = line.split()
+            if len(tokens) < 5:
+                continue
+            left, bottom, right, top = map(int, tokens[1:5])
+            # Box coordinates are counted from the bottom of the image.
+            center_x = (left + right) // 2
+            center_y = mosaic.shape[0] - (bottom + top) // 2
+            cell = min(center_y // cell_height, rows - 1) * columns + min(center_x // cell_width, columns - 1)
+            if cell < len(found):
+                found[cell].append(tokens[0])
 
+        retry = [i for i, chars in enumerate(found) if len(chars) != 1]
+        glyphs = [chars[0] if len(chars) == 1 else None for chars in found]
+        if retry:
+            self.logger.debug("Mosaic left %d of %d patches unrecognized", len(retry), len(patches))
+            for i, txt in zip(retry, self.__recognize_patches([patches[i] for i in retry])):
+                glyphs[i] = txt
         return glyphs
 
-    def __recognize_glyphs_v2(self, thresh, contours, rectangles):
-        inv_thresh = np.bitwise_not(thresh)
-        base = np.full(inv_thresh.shape, 255, dtype=thresh.dtype)
+    @staticmethod
+    def __color_features(image, thresh, rects, step=2):
+        # Mean color and hue histogram of the foreground pixels of every
+        # rect. Every `step`-th pixel of the rect crops is taken, and all of
+        # them are processed at once.
+        patches = [image[y:y + h:step, x:x + w:step].reshape(-1, image.shape[2]) for x, y, w, h in rects]
+        masks = [thresh[y:y + h:step, x:x + w:step].reshape(-1) for x, y, w, h in rects]
+        sizes = [len(patch) for patch in patches]
+        mask = np.concatenate(masks) > 0
+        owners = np.repeat(np.arange(len(rects)), sizes)[mask]
+        pixels = np.concatenate(patches)[mask]
+        hues = cv2.cvtColor(pixels[None, :, :], cv2.COLOR_BGR2HSV)[0, :, 0]
 
-        # noinspection PyShadowingNames
-        def func(image, rect):
-            w, h, x, y = rect
-            txt = tess.image_to_string(image, config=GUIConnector.__pytesseractConfig).strip()
-            self.logger.debug(f"Found {repr(txt)} at {w}x{h}+{x}+{y}")
-            return txt
+        rect_cnt = len(rects)
+        counts = np.maximum(np.bincount(owners, minlength=rect_cnt), 1)
+        means = np.stack([np.bincount(owners, weights=pixels[:, channel], minlength=rect_cnt) / counts
+                          for channel in range(pixels.shape[1])], axis=1)
+        bins = hues.astype(np.int64) * GUIConnector.__hueBins // 180
+        histograms = np.bincount(owners * GUIConnector.__hueBins + bins,
+                                 minlength=rect_cnt * GUIConnector.__hueBins).reshape(rect_cnt, -1)
+        histograms = histograms / counts[:, None]
 
-        images = [base.copy() for _ in rectangles]
-        for i, (x, y, w, h) in enumerate(rectangles):
-            images[i][y:y + h, x:x + w] = inv_thresh[y:y + h, x:x + w]
+        return np.hstack([means / 255, histograms * 0.1])
+
+    @staticmethod
+    def __balanced_kmeans(features, cluster_cnt, cluster_size, restarts=4, iterations=20):
+        # k-means where every cluster gets exactly cluster_size points:
+        # point-to-center pairs are assigned greedily from the closest one.
+        # Centers are seeded by the farthest point heuristic from a few
+        # different first points, and the run with the least inertia wins,
+        # so the result is deterministic.
+        best_assignment = None
+        best_inertia = None
+        for first in np.linspace(0, len(features) - 1, min(restarts, len(features))).astype(int):
+            centers = [features[first]]
+            nearest = np.sum((features - features[first]) ** 2, axis=1)
+            for _ in range(1, cluster_cnt):
+                centers.append(features[np.argmax(nearest)])
+                nearest = np.minimum(nearest, np.sum((features - centers[-1]) ** 2, axis=1))
+            centers = np.array(centers)
 
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            self.logger.debug("Running ThreadPoolExecutor")
-            glyphs = list(executor.map(func, images, rectangles))
-            # See https://docs.python.org/3/library/functions.html?highlight=unzip#zip
-            return glyphs
+            assignment = None
+            for _ in range(iterations):
+                distances = np.sum((features[:, None, :] - centers[None, :, :]) ** 2, axis=2)
+                new_assignment = GUIConnector.__assign_balanced(distances, cluster_size)
+                if assignment is not None and np.array_equal(assignment, new_assignment):
+                    break
+                assignment = new_assignment
+                centers = np.eye(cluster_cnt)[assignment].T @ features / cluster_size
+
+            inertia = np.sum((features - centers[assignment]) ** 2)
+            if best_inertia is None or inertia < best_inertia:
+                best_assignment = assignment
+                best_inertia = inertia
+
+        return best_assignment
+
+    @staticmethod
+    def __assign_balanced(distances, cluster_size):
+        # In every round each unassigned point proposes to its closest cluster
+        # with free places, and every cluster accepts its closest proposers.
+        point_cnt, cluster_cnt = distances.shape
+        assignment = np.full(point_cnt, -1)
+        free = np.full(cluster_cnt, cluster_size)
+        unassigned = np.arange(point_cnt)
+        while len(unassigned):
+            candidates = np.where(free > 0, distances[unassigned], np.inf)
+            choice = np.argmin(candidates, axis=1)
+            order = np.lexsort((candidates[np.arange(len(unassigned)), choice], choice))
+            sorted_choice = choice[order]
+            first = np.searchsorted(sorted_choice, sorted_choice)
+            accepted = order[np.arange(len(order)) - first < free[sorted_choice]]
+            assignment[unassigned[accepted]] = choice[accepted]
+            free -= np.bincount(choice[accepted], minlength=cluster_cnt)
+            unassigned = unassigned[assignment[unassigned] < 0]
+        return assignment
+
+    def __classify_colors(self, image, thresh, rects, rect_to_flask, flask_cnt):
+        # Labels balls by color clusters. As in Game.find_optimal_parameters,
+        # the fullest flask gives K, and there are exactly K balls of each of
+        # the N colors.
+        flask_sizes = np.bincount(rect_to_flask, minlength=flask_cnt)
+        capacity = int(flask_sizes.max())
+        if len(rects) % capacity != 0:
+            raise RuntimeError(f"{len(rects)} balls cannot be split into colors of {capacity}")
+        color_cnt = len(rects) // capacity
+        if color_cnt > len(GUIConnector.__colorLabels):
+            raise RuntimeError(f"Too many colors: {color_cnt}")
+
+        features = GUIConnector.__color_features(image, thresh, rects)
+        assignment = GUIConnector.__balanced_kmeans(features, color_cnt, capacity)
+
+        # Labels are given in order of first appearance.
+        label_of_cluster = dict()
+        glyphs = []
+        for cluster in assignment:
+            label = label_of_cluster.setdefault(cluster, GUIConnector.__colorLabels[len(label_of_cluster)])
+            glyphs.append(label)
+        self.logger.debug("Classified %d balls into %d colors", len(rects), color_cnt)
+        return glyphs
 
     @staticmethod
     def __find_flasks(rects, screen_width):
@@ -112,22 +255,221 @@ class GUIConnector:
 
         return tuple(tuple(map(lambda rect_id: glyphs[rect_id], flask)) for flask in flasks)
 
-    def read_game(self):
-        image = self.adb_connector.take_screenshot(self.device)
-        preprocessed_image = GUIConnector.__preprocess(image)
-        objects = GUIConnector.__find_objects(preprocessed_image)
-        rects = GUIConnector.__get_bounding_rectangles(objects)
-        glyphs = self.__recognize_glyphs(preprocessed_image, objects, rects)
-        flasks, rect_to_flask = GUIConnector.__find_flasks(rects, image.shape[1])
-        self.flask_coordinates = [algo.Geometry.rectangle_center(flask) for flask in flasks]
+    def __recognize_balls(self, image, thresh, rects, rect_to_flask, flask_cnt):
+        if self.recognition == 'color':
+            glyphs = self.__classify_colors(image, thresh, rects, rect_to_flask, flask_cnt)
+        else:
+            glyphs = self.__recognize_glyphs(thresh, rects)
 
-        game_configuration = GUIConnector.__build_game_configuration(rects, glyphs, rect_to_flask, len(flasks))
+        game_configuration = GUIConnector.__build_game_configuration(rects, glyphs, rect_to_flask, flask_cnt)
         self.logger.debug("Discovered configuration: %s", logic.Game.serialize_configuration(game_configuration))
         game_parameters = logic.Game.find_optimal_parameters(game_configuration)
-        game = logic.Game(game_parameters, game_configuration)
+        return logic.Game(game_parameters, game_configuration)
+
+    def __scan(self, image):
+        # Full-screen recognition; remembers the layout of the level.
+        preprocessed_image, _, rects = self.preprocessor.detect(image)
+        if not rects:
+            raise RuntimeError("Failed to recognize game")
+        flasks, rect_to_flask = GUIConnector.__find_flasks(rects, image.shape[1])
+        game = self.__recognize_balls(image, preprocessed_image, rects, rect_to_flask, len(flasks))
         if not game.is_valid():
+            self.__reject_glyphs()
             raise RuntimeError("Failed to recognize game")
+
+        layout = FlaskLayout(image.shape, flasks, rects)
+        self.layouts.pop(layout.key, None)
+        self.layouts[layout.key] = layout
+        self.logger.debug("Remembered layout of %d flasks", len(flasks))
+        return game, layout
+
+    def __scan_layout(self, image, layout):
+        # Recognition inside the flask regions of a known layout only.
+        # Returns None if the screen does not match the layout.
+        if not layout.matches(FramePreprocessor.binarize(layout.sample(image))):
+            return None
+
+        thresh = layout.buffer
+        rects = []
+        rect_to_flask = []
+        for flask_id, (x0, y0, x1, y1) in enumerate(layout.regions):
+            region = FramePreprocessor.binarize(image[y0:y1, x0:x1], thresh[y0:y1, x0:x1])
+            for x, y, w, h in FramePreprocessor.bounding_rectangles(FramePreprocessor.find_objects(region)):
+                if x == 0 or y == 0 or x + w == x1 - x0 or y + h == y1 - y0:
+                    # A ball sticks out of its flask.
+                    return None
+                rects.append((x0 + x, y0 + y, w, h))
+                rect_to_flask.append(flask_id)
+
+        if len(rects) != layout.ball_cnt:
+            return None
+        game = self.__recognize_balls(image, thresh, rects, rect_to_flask, len(layout.regions))
+        if not game.is_valid():
+            self.__reject_glyphs()
+            return None
+        return game
+
+    def accept_recognition(self):
+        # The game last read turned out right: new glyphs are remembered for
+        # good.
+        if self.glyph_cache is not None:
+            self.glyph_cache.commit()
+        self.near_glyphs = True
+
+    def reject_recognition(self):
+        # The game last read was wrong: new glyphs are forgotten and the next
+        # read_game() scans the whole screen.
+        self.__reject_glyphs()
+        self.layouts.clear()
+
+    def __reject_glyphs(self):
+        if self.glyph_cache is not None:
+            self.glyph_cache.rollback()
+        self.near_glyphs = False
+
+    def read_game(self):
+        image = self.adb_connector.take_screenshot(self.device)
+
+        game = None
+        for layout in reversed([layout for layout in self.layouts.values() if layout.shape == image.shape]):
+            game = self.__scan_layout(image, layout)
+            if game is not None:
+                self.logger.debug("Screen matches the known layout of %d flasks", len(layout.regions))
+                break
+        if game is None:
+            game, layout = self.__scan(image)
+
+        self.flask_coordinates = layout.centers
         return game
 
     def do_action(self, flask_id):
         self.adb_connector.tap(self.device, self.flask_coordinates[flask_id])
+
+    def do_actions(self, flask_ids, delay, should_continue=None):
+        # Taps the flasks in one batch, see ADBConnector.tap_sequence();
+        # returns the number of taps made.
+        points = [self.flask_coordinates[flask_id] for flask_id in flask_ids]
+        return self.adb_connector.tap_sequence(self.device, points, delay, should_continue=should_continue)
+
+
+class FlaskLayout:
+    # Positions of the flasks of a level. Levels with the same number of
+    # flasks are laid out the same, so the flask regions of a scanned level
+    # are reused for the next ones.
+    __margin = 0.25
+    __sampleStep = 8
+
+    def __init__(self, shape, flasks, rects):
+        self.shape = shape
+        self.key = (shape, len(flasks))
+        self.centers = [algo.Geometry.rectangle_center(flask) for flask in flasks]
+        self.ball_cnt = len(rects)
+
+        # Flask rects are bounding rects of their balls; a region adds a
+        # margin of a quarter of a ball around them.
+        top, bottom = FramePreprocessor.play_area(shape[0])
+        ball_size = max(min(w, h) for x, y, w, h in rects)
+        margin = max(int(ball_size * FlaskLayout.__margin), 1)
+        self.regions = [(max(x - margin, 0), max(y - margin, top),
+                         min(x + w + margin, shape[1]), min(y + h + margin, bottom)) for x, y, w, h in flasks]
+
+        # Balls outside of the regions are looked for on a sparse grid of the
+        # play area.
+        step = FlaskLayout.__sampleStep
+        self.sample_rows = slice(top, bottom, step)
+        self.sample_columns = slice(0, shape[1], step)
+        outside = np.ones(shape[:2], dtype=bool)
+        for x0, y0, x1, y1 in self.regions:
+            outside[y0:y1, x0:x1] = False
+        self.sample_outside = outside[self.sample_rows, self.sample_columns]
+
+        # Reusable thresholded screen; only the regions are ever written.
+        self.buffer = np.zeros(shape[:2], dtype=np.uint8)
+
+    def sample(self, image):
+        return image[self.sample_rows, self.sample_columns]
+
+    def matches(self, sample_thresh):
+        return not np.any(sample_thresh[self.sample_outside])
+
+
+class FramePreprocessor:
+    # Thresholds screenshots and finds the balls on them. The thresholded
+    # screen is written into a buffer which is reused between frames.
+    __threshold = 100
+
+    def __init__(self, scale=1):
+        # scale is an integer factor the screen is downscaled by before the
+        # balls are looked for.
+        if scale < 1 or int(scale) != scale:
+            raise ValueError(f"Bad preprocessing scale: {scale}")
+        self.scale = int(scale)
+        self.buffer = None
+        self.small = None
+        self.small_thresh = None
+
+    @staticmethod
+    def play_area(image_height):
+        # Rows between the header and the footer
+        header_height = int(image_height / 10)
+        footer_height = int(image_height / 10)
+        return header_height, image_height - footer_height
+
+    @staticmethod
+    def binarize(image, out=None):
+        # A pixel is foreground if any of its channels is above the
+        # threshold. The gray level is a weighted mean of the channels, so
+        # thresholding it as well adds nothing.
+        channels = image.shape[-1]
+        out = cv2.inRange(image, (0,) * channels, (FramePreprocessor.__threshold,) * channels, dst=out)
+        return cv2.bitwise_not(out, dst=out)
+
+    @staticmethod
+    def find_objects(image, offset=(0, 0)):
+        items = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+        contours = items[0] if len(items) == 2 else items[1]
+        return contours
+
+    @staticmethod
+    def bounding_rectangles(contours):
+        return [cv2.boundingRect(contour) for contour in contours]
+
+    def detect(self, image):
+        # Returns (thresholded screen, contours of the balls, their bounding
+        # rects). The header and the footer are not processed at all.
+        height, width = image.shape[:2]
+        if self.buffer is None or self.buffer.shape != (height, width):
+            self.buffer = np.zeros((height, width), dtype=np.uint8)
+        thresh = self.buffer
+        top, bottom = FramePreprocessor.play_area(height)
+
+        if self.scale == 1:
+            FramePreprocessor.binarize(image[top:bottom], thresh[top:bottom])
+            contours = FramePreprocessor.find_objects(thresh[top:bottom], (0, top))
+            return thresh, contours, FramePreprocessor.bounding_rectangles(contours)
+
+        # Balls are found on the downscaled screen, then only their
+        # surroundings are thresholded at full resolution to fit the rects.
+        scale = self.scale
+        small_shape = ((bottom - top) // scale, width // scale)
+        if self.small is None or self.small.shape[:2] != small_shape:
+            self.small = np.empty(small_shape + image.shape[2:], dtype=np.uint8)
+            self.small_thresh = np.empty(small_shape, dtype=np.uint8)
+        cv2.resize(image[top:bottom], small_shape[::-1], dst=self.small, interpolation=cv2.INTER_AREA)
+        FramePreprocessor.binarize(self.small, self.small_thresh)
+        thresh[top:bottom] = 0
+        contours = []
+        rects = []
+        for contour in FramePreprocessor.find_objects(self.small_thresh):
+            x, y, w, h = cv2.boundingRect(contour)
+            x0 = max((x - 1) * scale, 0)
+            y0 = max(top + (y - 1) * scale, top)
+            x1 = min((x + w + 1) * scale, width)
+            y1 = min(top + (y + h + 1) * scale, bottom)
+            region = FramePreprocessor.binarize(image[y0:y1, x0:x1], thresh[y0:y1, x0:x1])
+            rx, ry, rw, rh = cv2.boundingRect(region)
+            if rw == 0 or rh == 0:
+                continue
+            contours.append(contour * scale + (0, top))
+            rects.append((x0 + rx, y0 + ry, rw, rh))
+        return thresh, contours, rects
@@ -0,0 +1,48 @@
+import random
+import string
+
+import logic
+
+
+"""
+Генератор уровней.
+
+Уровень с параметрами (N, M, K) получается случайным перемешиванием NK
+шариков по N колбам, M колб остаются пустыми. Перемешивание повторяется,
+пока решатель не подтвердит, что у уровня есть решение, поэтому генератор
+выдаёт только решаемые уровни. Бюджет решателя задан числом раскрытых
+узлов, а не временем, так что результат полностью определяется seed и не
+зависит от скорости машины.
+"""
+
+
+GLYPHS = string.ascii_uppercase + string.digits + string.ascii_lowercase
+
+
+def shuffled_configuration(parameters, rnd):
+    if parameters.N > len(GLYPHS):
+        raise ValueError(f"Too many colors: {parameters.N}")
+
+    balls = [GLYPHS[color] for color in range(parameters.N) for _ in range(parameters.K)]
+    rnd.shuffle(balls)
+    filled = tuple(tuple(balls[i * parameters.K:(i + 1) * parameters.K]) for i in range(parameters.N))
+    return filled + ((),) * parameters.M
+
+
+def generate_level(parameters, seed, max_attempts=100, max_nodes=100000):
+    rnd = random.Random(seed)
+    solver = logic.Solver(canonicalize=True, max_nodes=max_nodes)
+
+    for _ in range(max_attempts):
+        game = logic.Game(parameters, shuffled_configuration(parameters, rnd))
+        try:
+            if solver.solve(game) is not None:
+                return game
+        except logic.SearchAborted:
+            pass
+
+    raise RuntimeError(f"Failed to generate a solvable level for {parameters} with seed {seed}")
+
+
+def generate_levels(parameters, seeds, **kwargs):
+    return [generate_level(parameters, seed, **kwargs) for seed in seeds]
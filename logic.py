@@ -1,10 +1,18 @@
+import os
+import sys
+import time
 from collections import namedtuple
 from collections.abc import Hashable
-from dataclasses import dataclass, field
-from typing import Any
-from queue import PriorityQueue
 
 import log
+import parallel
+import pattern_db
+import search
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
 """
@@ -173,53 +181,631 @@ class Game:
 
         return True
 
+    def unsolvability_reason(self):
+        # Cheap static checks. Returns why the game certainly has no solution,
+        # or None if it may have one.
+        parameters = self.parameters
+        if len(self.configuration) != parameters.N + parameters.M:
+            return f"Expected {parameters.N + parameters.M} flasks, got {len(self.configuration)}"
+
+        counter = dict()
+        for i, flask in enumerate(self.configuration):
+            if len(flask) > parameters.K:
+                return f"Flask {i} holds {len(flask)} balls, capacity is {parameters.K}"
+            for ball in flask:
+                counter[ball] = counter.get(ball, 0) + 1
 
-@dataclass(order=True)
-class PrioritizedItem:
-    priority: int
-    item: Any = field(compare=False)
+        if len(counter) > parameters.N:
+            return f"Expected {parameters.N} colors, got {len(counter)}"
+        for ball, count in counter.items():
+            if count != parameters.K:
+                return f"Color {ball!r} has {count} balls, expected {parameters.K}"
 
+        if self.is_winning_configuration():
+            return None
+        flask_cnt = len(self.configuration)
+        if not any(self.can_do_a_move(i, j) for i in range(flask_cnt) for j in range(flask_cnt)):
+            return "No legal moves"
+        return None
 
-class Solver:
+
+class StateCodec:
+    # Packed state layout: flask i occupies bytes [i * K, (i + 1) * K) of a
+    # single bytes object, bottom ball first, padded with zeros. Balls are
+    # interned as color indices 1..N in order of first appearance.
+
+    NO_MOVE = 255
+
+    def __init__(self, parameters, configuration):
+        self.parameters = parameters
+        self.flask_cnt = parameters.N + parameters.M
+        self.capacity = parameters.K
+        self.colors = [None]
+        self.color_index = dict()
+
+        for flask in configuration:
+            for ball in flask:
+                if ball not in self.color_index:
+                    self.color_index[ball] = len(self.colors)
+                    self.colors.append(ball)
+
+        if len(self.colors) > 256 or self.flask_cnt > 255:
+            raise ValueError("Configuration is too large to be packed")
+
+    def encode(self, configuration):
+        state = bytearray(self.flask_cnt * self.capacity)
+        for i, flask in enumerate(configuration):
+            offset = i * self.capacity
+            for k, ball in enumerate(flask):
+                state[offset + k] = self.color_index[ball]
+        return bytes(state)
+
+    def encode_move(self, i, j, count=1):
+        return (count * self.flask_cnt + i) * self.flask_cnt + j
+
+    def decode_move(self, move):
+        move, j = divmod(move, self.flask_cnt)
+        count, i = divmod(move, self.flask_cnt)
+        return i, j, count
+
+    def heights(self, state):
+        capacity = self.capacity
+        result = []
+        for offset in range(0, len(state), capacity):
+            height = state.find(0, offset, offset + capacity)
+            result.append(capacity if height < 0 else height - offset)
+        return result
+
+    def initial_meta(self, state):
+        # Per-flask metadata kept alongside a state during the search: heights
+        # in the first F bytes, lengths of the single-color top runs in the
+        # next F bytes. A flask is complete iff its top run has length K. The
+        # last three bytes hold the source, the target and the ball count of
+        # the move that led to the state (NO_MOVE for the initial one).
+        heights = self.heights(state)
+        runs = [self.__top_run(state, i, height) for i, height in enumerate(heights)]
+        return bytes(heights + runs + [StateCodec.NO_MOVE, StateCodec.NO_MOVE, 0])
+
+    def __top_run(self, state, i, height):
+        if height == 0:
+            return 0
+        offset = i * self.capacity
+        top = state[offset + height - 1]
+        k = height - 1
+        while k > 0 and state[offset + k - 1] == top:
+            k -= 1
+        return height - k
+
+    def is_winning_meta(self, meta):
+        capacity = self.capacity
+        flask_cnt = self.flask_cnt
+        for i in range(flask_cnt):
+            if meta[i] and meta[flask_cnt + i] != capacity:
+                return False
+        return True
+
+    def children(self, state, meta, score):
+        # Expands a node in O(flasks + moves): targets are looked up by their
+        # top color, and the metadata and the color change count of a child
+        # are derived from the parent's ones instead of being recomputed.
+        capacity = self.capacity
+        flask_cnt = self.flask_cnt
+
+        empty = []
+        by_top = dict()
+        for i in range(flask_cnt):
+            height = meta[i]
+            if height == 0:
+                empty.append(i)
+            elif height < capacity:
+                by_top.setdefault(state[i * capacity + height - 1], []).append(i)
+
+        last_move = 2 * flask_cnt
+        last_src = meta[last_move]
+        last_dst = meta[last_move + 1]
+
+        for i in range(flask_cnt):
+            height_i = meta[i]
+            run_i = meta[flask_cnt + i]
+            if height_i == 0 or run_i == capacity:
+                continue
+
+            src = i * capacity + height_i - 1
+            color = state[src]
+            new_score = score - 1 if run_i == 1 and height_i > 1 else score
+
+            for targets in (by_top.get(color, ()), empty):
+                for j in targets:
+                    if j == i or (i == last_dst and j == last_src):
+                        continue
+                    height_j = meta[j]
+
+                    new_state = bytearray(state)
+                    new_state[j * capacity + height_j] = color
+                    new_state[src] = 0
+
+                    new_meta = bytearray(meta)
+                    new_meta[i] = height_i - 1
+                    new_meta[j] = height_j + 1
+                    new_meta[flask_cnt + j] = meta[flask_cnt + j] + 1 if height_j else 1
+                    if run_i > 1:
+                        new_meta[flask_cnt + i] = run_i - 1
+                    else:
+                        new_meta[flask_cnt + i] = self.__top_run(new_state, i, height_i - 1)
+                    new_meta[last_move:] = bytes((i, j, 1))
+
+                    yield i, j, bytes(new_state), bytes(new_meta), new_score
+
+    def macro_children(self, state, meta, score):
+        # Same as `children`, but every move takes as much of the top run of
+        # the source as fits into the target, and dominated moves are skipped:
+        #  - moves that exactly undo the previous move;
+        #  - moves of a single-color flask into an empty one;
+        #  - moves into any empty flask but the first one, as they are equal;
+        #  - one of the two directions between two single-color flasks of the
+        #    same color, as both results are equal up to flask permutation.
+        # Yields (i, j, count, state, meta, score).
+        capacity = self.capacity
+        flask_cnt = self.flask_cnt
+
+        empty = None
+        by_top = dict()
+        for i in range(flask_cnt):
+            height = meta[i]
+            if height == 0:
+                if empty is None:
+                    empty = i
+            elif height < capacity:
+                by_top.setdefault(state[i * capacity + height - 1], []).append(i)
+
+        last_move = 2 * flask_cnt
+        last_src = meta[last_move]
+        last_dst = meta[last_move + 1]
+        last_cnt = meta[last_move + 2]
+
+        for i in range(flask_cnt):
+            height_i = meta[i]
+            run_i = meta[flask_cnt + i]
+            if height_i == 0 or run_i == capacity:
+                continue
+
+            offset_i = i * capacity
+            color = state[offset_i + height_i - 1]
+            single_color_i = height_i == run_i
+
+            targets = list(by_top.get(color, ()))
+            if empty is not None and not single_color_i:
+                targets.append(empty)
+
+            for j in targets:
+                if j == i:
+                    continue
+                height_j = meta[j]
+                run_j = meta[flask_cnt + j]
+                if single_color_i and height_j == run_j and (height_i, j) > (height_j, i):
+                    continue
+                count = min(run_i, capacity - height_j)
+                if i == last_dst and j == last_src and count == last_cnt:
+                    continue
+
+                new_state = bytearray(state)
+                offset_j = j * capacity
+                new_state[offset_j + height_j:offset_j + height_j + count] = bytes((color,)) * count
+                new_state[offset_i + height_i - count:offset_i + height_i] = bytes(count)
+
+                new_meta = bytearray(meta)
+                new_meta[i] = height_i - count
+                new_meta[j] = height_j + count
+                new_meta[flask_cnt + j] = run_j + count if height_j else count
+                if count < run_i:
+                    new_meta[flask_cnt + i] = run_i - count
+                    new_score = score
+                else:
+                    new_meta[flask_cnt + i] = self.__top_run(new_state, i, height_i - count)
+                    new_score = score - 1 if height_i > run_i else score
+                new_meta[last_move:] = bytes((i, j, count))
+
+                yield i, j, count, bytes(new_state), bytes(new_meta), new_score
+
+    def moves(self, state):
+        capacity = self.capacity
+        heights = self.heights(state)
+        tops = [state[i * capacity + height - 1] if height > 0 else 0 for i, height in enumerate(heights)]
+
+        for i, height_i in enumerate(heights):
+            if height_i == 0:
+                continue
+            color = tops[i]
+            if height_i == capacity and state.count(color, i * capacity, (i + 1) * capacity) == capacity:
+                continue
+            for j, height_j in enumerate(heights):
+                if i == j or height_j == capacity:
+                    continue
+                if height_j > 0 and tops[j] != color:
+                    continue
+                yield i, j, height_i, height_j
+
+    def do_a_move(self, state, i, j, height_i, height_j):
+        new_state = bytearray(state)
+        src = i * self.capacity + height_i - 1
+        new_state[j * self.capacity + height_j] = new_state[src]
+        new_state[src] = 0
+        return bytes(new_state)
+
+    def is_deadlocked(self, state, meta):
+        # True if a state which is not winning can never empty a flask or
+        # uncover a ball under a top run. With no empty flask a ball only
+        # moves onto its own color, so the open flasks topped with one color
+        # trade balls among themselves and their total free space stays the
+        # same; the top run of one of them can be moved away entirely only if
+        # that free space is at least the capacity minus the balls under the
+        # run. If no flask passes this check, the moves left only shuffle top
+        # runs back and forth or undo each other. A state without any legal
+        # move is the simplest case of this.
+        flask_cnt = self.flask_cnt
+        capacity = self.capacity
+        color_cnt = len(self.colors)
+        free = [0] * color_cnt
+        # The least free space needed to clear a top run, per top color
+        needed = [capacity] * color_cnt
+        tops = []
+        for i in range(flask_cnt):
+            height = meta[i]
+            if height == 0:
+                return False
+            run = meta[flask_cnt + i]
+            if run == capacity:
+                continue
+            color = state[i * capacity + height - 1]
+            free[color] += capacity - height
+            if capacity - height + run < needed[color]:
+                needed[color] = capacity - height + run
+            tops.append(color)
+
+        if not tops:
+            return False
+        for color in tops:
+            if free[color] >= needed[color]:
+                return False
+        return True
+
+    def canonical_key(self, state, relabel_colors=False):
+        # Flasks are interchangeable, and so are colors, so any state obtained
+        # by permuting them is equivalent to the original one. The key below
+        # is such a permuted state, hence equal keys mean equivalent states.
+        capacity = self.capacity
+        rows = [state[offset:offset + capacity] for offset in range(0, len(state), capacity)]
+
+        if relabel_colors:
+            rows.sort(key=StateCodec.__row_pattern)
+            mapping = bytearray(256)
+            next_color = 1
+            for row in rows:
+                for color in row:
+                    if color and not mapping[color]:
+                        mapping[color] = next_color
+                        next_color += 1
+            table = bytes(mapping)
+            rows = [row.translate(table) for row in rows]
+
+        rows.sort()
+        return b''.join(rows)
+
+    @staticmethod
+    def __row_pattern(row):
+        # Color-independent shape of a flask: colors renumbered by their first
+        # appearance within the flask itself.
+        mapping = dict()
+        return bytes(mapping.setdefault(color, len(mapping) + 1) if color else 0 for color in row)
+
+    def count_color_changes(self, state):
+        result = 0
+        capacity = self.capacity
+        for offset in range(0, len(state), capacity):
+            for k in range(offset + 1, offset + capacity):
+                if state[k] == 0:
+                    break
+                if state[k] != state[k - 1]:
+                    result += 1
+        return result
+
+    def count_flask_fullness(self, state):
+        return sum(min(height, self.capacity - height) for height in self.heights(state))
+
+    def is_winning_state(self, state):
+        capacity = self.capacity
+        for offset in range(0, len(state), capacity):
+            bottom = state[offset]
+            if bottom and state.count(bottom, offset, offset + capacity) != capacity:
+                return False
+        return True
+
+
+class SearchAborted(RuntimeError):
+    # `reason` is the exhausted budget: 'time', 'nodes' or 'memory'.
+
+    def __init__(self, reason, message=None):
+        super().__init__(message or f"{reason.capitalize()} limit exceeded")
+        self.reason = reason
+
+    def __reduce__(self):
+        return SearchAborted, (self.reason, str(self))
+
+
+class SolverStats:
     def __init__(self):
-        self.logger = log.get_logger(log.class_fullname(self))
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.dead_ends = 0
+        self.discovered = 0
+        self.frontier_peak = 0
+        self.elapsed = 0.0
+        self.cached = False
+        self.aborted = None
+        self.unsolvable = None
 
-    def solve(self, initial_game):
-        num_of_flasks = initial_game.parameters.N + initial_game.parameters.M
+    def __repr__(self):
+        return f"SolverStats({', '.join(f'{key}={value!r}' for key, value in vars(self).items())})"
+
+    def as_dict(self):
+        return dict(vars(self))
 
-        heap = PriorityQueue()
-        heap.put(PrioritizedItem(initial_game.priority(), initial_game))
 
-        discovered = dict()
-        discovered[initial_game.configuration] = None
+class SearchMonitor:
+    # Owns the statistics of a single search run, enforces its budgets and
+    # reports progress. Everything except the node count is checked every
+    # CHECK_INTERVAL expansions only, so a budget may be overrun slightly.
+    # max_memory limits the resident set size of the whole process, in bytes.
 
-        winning_game = None
+    CHECK_INTERVAL = 256
 
-        while not heap.empty():
-            prior_item = heap.get()
-            # priority = prior_item.priority
-            game = prior_item.item
+    def __init__(self, deadline=None, max_nodes=None, max_memory=None, progress=None, progress_interval=1.0):
+        self.start = time.monotonic()
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.max_memory = max_memory
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.next_progress = self.start + progress_interval
+        self.stats = SolverStats()
 
-            if game.is_winning_configuration():
-                self.logger.info("Found winning configuration")
-                winning_game = game
-                break
+    def __getstate__(self):
+        # Callbacks are usually not picklable; copies of the monitor in other
+        # processes only enforce the budgets.
+        state = self.__dict__.copy()
+        state['progress'] = None
+        return state
+
+    @staticmethod
+    def memory_usage():
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            pass
+        if resource is None:
+            return None
+        # The peak is the best approximation available elsewhere; macOS
+        # reports it in bytes, other systems in kilobytes.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def expand(self):
+        stats = self.stats
+        stats.expanded += 1
+        if self.max_nodes is not None and stats.expanded > self.max_nodes:
+            self.abort('nodes')
+        if stats.expanded % SearchMonitor.CHECK_INTERVAL == 0:
+            self.check()
+
+    def check(self):
+        now = time.monotonic()
+        self.stats.elapsed = now - self.start
+        if self.deadline is not None and now > self.deadline:
+            self.abort('time')
+        if self.max_nodes is not None and self.stats.expanded > self.max_nodes:
+            self.abort('nodes')
+        if self.max_memory is not None:
+            memory = SearchMonitor.memory_usage()
+            if memory is not None and memory > self.max_memory:
+                self.abort('memory')
+        if self.progress is not None and now >= self.next_progress:
+            self.next_progress = now + self.progress_interval
+            self.progress(self.stats)
+
+    def abort(self, reason):
+        self.stats.aborted = reason
+        raise SearchAborted(reason)
+
+    def finish(self):
+        self.stats.elapsed = time.monotonic() - self.start
+
+
+class SearchSpace:
+    # Adapter between a packed game and the engines from the `search` module.
+    # Every engine expands nodes through children(), so statistics and
+    # budgets are handled here for all of them by the monitor. Children
+    # without any legal move are dead ends and are never yielded.
+
+    HEURISTICS = ('color_changes', 'flask_fullness', 'pattern_database')
+
+    def __init__(self, codec, initial_state, canonicalize=False, relabel_colors=False, macro_moves=False,
+                 heuristic='color_changes', monitor=None, pattern_database=None):
+        if heuristic not in SearchSpace.HEURISTICS:
+            raise ValueError(f"Unknown heuristic: {heuristic}")
+        if heuristic == 'pattern_database' and pattern_database is None:
+            raise ValueError("Pattern database heuristic requires a database")
+
+        self.codec = codec
+        self.parameters = codec.parameters
+        self.initial_state = initial_state
+        self.canonicalize = canonicalize
+        self.relabel_colors = relabel_colors
+        self.macro_moves = macro_moves
+        self.heuristic = heuristic
+        self.fullness = [min(height, codec.capacity - height) for height in range(codec.capacity + 1)]
+        self.pattern_database = pattern_database
+        self.monitor = SearchMonitor() if monitor is None else monitor
+        self.stats = self.monitor.stats
+
+    def initial(self):
+        state = self.initial_state
+        if self.heuristic == 'flask_fullness':
+            h = self.codec.count_flask_fullness(state)
+        elif self.heuristic == 'pattern_database':
+            h = self.pattern_database.evaluate(state)
+        else:
+            h = self.codec.count_color_changes(state)
+        return state, self.codec.initial_meta(state), h
+
+    def key(self, state):
+        if self.canonicalize:
+            return self.codec.canonical_key(state, self.relabel_colors)
+        return state
+
+    def is_goal(self, meta):
+        return self.codec.is_winning_meta(meta)
+
+    def children(self, state, meta, h):
+        # The cost of a move is the number of balls moved, i.e. the number of
+        # tap pairs needed to play it. The codec keeps the color change count
+        # up to date; flask fullness is updated here from the two heights,
+        # and the pattern database is looked up for every child.
+        self.monitor.expand()
+        stats = self.stats
+        encode_move = self.codec.encode_move
+        fullness = self.fullness if self.heuristic == 'flask_fullness' else None
+        pattern_database = self.pattern_database if self.heuristic == 'pattern_database' else None
+
+        if self.macro_moves:
+            children = self.codec.macro_children(state, meta, h)
+        else:
+            children = ((i, j, 1, new_state, new_meta, new_h)
+                        for i, j, new_state, new_meta, new_h in self.codec.children(state, meta, h))
+
+        is_deadlocked = self.codec.is_deadlocked
+        for i, j, count, new_state, new_meta, new_h in children:
+            stats.generated += 1
+            if is_deadlocked(new_state, new_meta):
+                stats.dead_ends += 1
+                continue
+            if fullness is not None:
+                new_h = (h + fullness[new_meta[i]] - fullness[meta[i]]
+                         + fullness[new_meta[j]] - fullness[meta[j]])
+            elif pattern_database is not None:
+                new_h = pattern_database.evaluate(new_state)
+            yield encode_move(i, j, count), new_state, new_meta, new_h, count
+
+    def decode_move(self, move):
+        i, j, count = self.codec.decode_move(move)
+        return [(i, j)] * count
 
-            for i in range(num_of_flasks):
-                for j in range(num_of_flasks):
-                    if game.can_do_a_move(i, j):
-                        new_game = game.do_a_move_unsafe(i, j)
-                        if new_game.configuration not in discovered:
-                            discovered[new_game.configuration] = game.configuration
-                            heap.put(PrioritizedItem(new_game.priority(), new_game))
 
-        if winning_game is None:
+class Solver:
+    def __init__(self, strategy=None, canonicalize=False, relabel_colors=False, macro_moves=True, workers=1,
+                 heuristic='color_changes', cache=None, time_limit=None, max_nodes=None, max_memory=None,
+                 progress=None, progress_interval=1.0, pattern_databases=None):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.strategy = search.GreedyBestFirst() if strategy is None else strategy
+        if workers > 1:
+            if not isinstance(self.strategy, search.BestFirstSearch):
+                raise ValueError(f"Parallel search is not supported for {self.strategy}")
+            if self.strategy.cost_bound is not None:
+                raise ValueError("Parallel search does not support cost bounds")
+            if self.strategy.g_weight:
+                # The first goal found by any worker is returned, so A* and
+                # weighted A* would lose their bound on the solution cost.
+                raise ValueError(f"Parallel search is not supported for {self.strategy}: it is greedy only")
+            self.strategy = parallel.HashDistributedSearch(workers, g_weight=self.strategy.g_weight,
+                                                           h_weight=self.strategy.h_weight)
+        self.canonicalize = canonicalize
+        self.relabel_colors = relabel_colors
+        self.macro_moves = macro_moves
+        self.heuristic = heuristic
+        self.cache = cache
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+        self.max_memory = max_memory
+        self.progress = progress
+        self.progress_interval = progress_interval
+        if heuristic == 'pattern_database' and pattern_databases is None:
+            pattern_databases = pattern_db.PatternDatabases()
+        self.pattern_databases = pattern_databases
+        self.stats = SolverStats()
+
+    @staticmethod
+    def moves_from_solution(solution):
+        moves = []
+        for old_configuration, new_configuration in zip(solution, solution[1:]):
+            src = None
+            dst = None
+            for j, (old, new) in enumerate(zip(old_configuration, new_configuration)):
+                if len(old) < len(new):
+                    dst = j
+                if len(new) < len(old):
+                    src = j
+            moves.append((src, dst))
+        return moves
+
+    def solve(self, initial_game):
+        # Raises SearchAborted if a budget is exhausted; statistics of the
+        # last run are left in self.stats either way. progress(stats) is
+        # called at most every progress_interval seconds during the search.
+        monitor = SearchMonitor(max_nodes=self.max_nodes, max_memory=self.max_memory, progress=self.progress,
+                                progress_interval=self.progress_interval)
+        if self.time_limit is not None:
+            monitor.deadline = monitor.start + self.time_limit
+        self.stats = monitor.stats
+        try:
+            reason = initial_game.unsolvability_reason()
+            if reason is not None:
+                self.logger.warning("Game is unsolvable: %s", reason)
+                self.stats.unsolvable = reason
+                return None
+
+            if self.cache is not None:
+                solution = self.cache.get(initial_game)
+                if solution is not None:
+                    self.logger.info("Found cached solution")
+                    self.stats.cached = True
+                    return solution
+
+            solution = self.__search(initial_game, monitor)
+            if solution is not None and self.cache is not None:
+                self.cache.put(initial_game, solution)
+            return solution
+        finally:
+            monitor.finish()
+            self.logger.debug("Search finished: %s", self.stats)
+
+    def __search(self, initial_game, monitor):
+        codec = StateCodec(initial_game.parameters, initial_game.configuration)
+        heuristic = self.heuristic
+        database = None
+        if heuristic == 'pattern_database':
+            database = self.pattern_databases.get(initial_game.parameters)
+            if database is None:
+                heuristic = 'color_changes'
+        space = SearchSpace(codec, codec.encode(initial_game.configuration),
+                            canonicalize=self.canonicalize, relabel_colors=self.relabel_colors,
+                            macro_moves=self.macro_moves, heuristic=heuristic, monitor=monitor,
+                            pattern_database=database)
+
+        # Keys may be canonicalized, but moves always refer to the physical
+        # flasks of the parent state that was actually expanded, so replaying
+        # them from the initial game yields real tap targets.
+        self.logger.debug("Searching with %s", self.strategy)
+        path = self.strategy.search(space)
+        if path is None:
             return None
+        self.logger.info("Found winning configuration")
 
-        result = list()
-        result.append(winning_game.configuration)
-        while discovered[result[-1]] is not None:
-            result.append(discovered[result[-1]])
+        game = initial_game
+        result = [game.configuration]
+        for move in path:
+            for i, j in space.decode_move(move):
+                game = game.do_a_move_unsafe(i, j)
+                result.append(game.configuration)
 
-        result.reverse()
         return result
@@ -0,0 +1,137 @@
+import log
+import logic
+
+
+"""
+Сокращение найденных решений перед проигрыванием.
+
+Решение -- последовательность конфигураций. Оптимизатор проходит по ней и
+ - склеивает переносы одного шарика: ход A->B и следующий за ним ход того же
+   шарика B->C заменяются одним ходом A->C (раньше или позже), а ход,
+   возвращающий шарик на место, исчезает вместе с исходным;
+ - вырезает циклы: если конфигурация встречается на пути повторно, всё
+   между двумя вхождениями лишнее;
+ - ищет короткие пути: из i-й конфигурации перебираются все
+   последовательности из не более чем max_depth ходов, и если одна из них
+   приводит в j-ю конфигурацию пути быстрее, чем за j - i ходов, участок
+   пути заменяется ею.
+Поиск ведётся в упакованных состояниях logic.StateCodec, а каждая замена
+перед применением проверяется ходами Game.can_do_a_move: остаток пути
+после склейки должен по-прежнему приводить к выигрышу.
+"""
+
+
+class SolutionOptimizer:
+    def __init__(self, max_depth=2, max_passes=4):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.max_depth = max_depth
+        self.max_passes = max_passes
+
+    def optimize(self, initial_game, solution):
+        if solution is None or len(solution) < 3:
+            return solution
+
+        codec = logic.StateCodec(initial_game.parameters, initial_game.configuration)
+        result = list(solution)
+        for _ in range(self.max_passes):
+            length = len(result)
+            result = self.__merge_pass(initial_game.parameters, result)
+            result = self.__shortcut_pass(initial_game.parameters, codec, result)
+            if len(result) == length:
+                break
+
+        if len(result) < len(solution):
+            self.logger.info("Solution shortened from %d to %d moves", len(solution) - 1, len(result) - 1)
+        return result
+
+    def __merge_pass(self, parameters, solution):
+        moves = logic.Solver.moves_from_solution(solution)
+        s = 0
+        while s < len(moves):
+            src, dst = moves[s]
+            # The ball stays on top of dst until the next move touching dst.
+            t = s + 1
+            while t < len(moves) and dst not in moves[t]:
+                t += 1
+            if t == len(moves) or moves[t][0] != dst:
+                s += 1
+                continue
+
+            merged = [] if moves[t][1] == src else [(src, moves[t][1])]
+            between = moves[s + 1:t]
+            for candidate in (merged + between, between + merged):
+                configurations = SolutionOptimizer.__replay(parameters, solution[s], candidate + moves[t + 1:])
+                if configurations is None:
+                    continue
+                final = configurations[-1] if configurations else solution[s]
+                if logic.Game(parameters, final).is_winning_configuration():
+                    moves[s:t + 1] = candidate
+                    solution[s + 1:] = configurations
+                    break
+            else:
+                s += 1
+
+        return solution
+
+    def __shortcut_pass(self, parameters, codec, solution):
+        states = [codec.encode(configuration) for configuration in solution]
+        i = 0
+        while i < len(states) - 1:
+            last = {state: index for index, state in enumerate(states)}
+
+            j = last[states[i]]
+            if j > i:
+                # The configuration repeats, so the loop between is a no-op.
+                del states[i + 1:j + 1]
+                del solution[i + 1:j + 1]
+                continue
+
+            shortcut = self.__find_shortcut(codec, states[i], i, last)
+            if shortcut is not None:
+                j, moves = shortcut
+                configurations = SolutionOptimizer.__replay(parameters, solution[i], moves)
+                if configurations is not None and configurations[-1] == solution[j]:
+                    states[i + 1:j + 1] = [codec.encode(configuration) for configuration in configurations]
+                    solution[i + 1:j + 1] = configurations
+                    continue
+                self.logger.warning("Rejected invalid shortcut from move %d to move %d", i, j)
+
+            i += 1
+
+        return solution
+
+    def __find_shortcut(self, codec, start, i, last):
+        # Breadth-first search from `start`; returns the shortcut with the
+        # largest gain as (j, moves), or None.
+        best = None
+        best_gain = 0
+        layer = [(start, [])]
+        seen = {start}
+        for depth in range(1, self.max_depth + 1):
+            next_layer = []
+            for state, moves in layer:
+                for src, dst, height_src, height_dst in codec.moves(state):
+                    new_state = codec.do_a_move(state, src, dst, height_src, height_dst)
+                    if new_state in seen:
+                        continue
+                    seen.add(new_state)
+                    new_moves = moves + [(src, dst)]
+                    j = last.get(new_state)
+                    if j is not None and j - i - depth > best_gain:
+                        best = (j, new_moves)
+                        best_gain = j - i - depth
+                    next_layer.append((new_state, new_moves))
+            layer = next_layer
+
+        return best
+
+    @staticmethod
+    def __replay(parameters, configuration, moves):
+        game = logic.Game(parameters, configuration)
+        configurations = []
+        for i, j in moves:
+            if not game.can_do_a_move(i, j):
+                return None
+            game = game.do_a_move_unsafe(i, j)
+            configurations.append(game.configuration)
+        return configurations
@@ -0,0 +1,299 @@
+import heapq
+import multiprocessing
+import queue
+import zlib
+from array import array
+
+import logic
+
+
+"""
+Параллельный поиск с распределением состояний по хешу (HDA*).
+
+Каждое состояние принадлежит ровно одному процессу-исполнителю, номер
+которого вычисляется по хешу ключа состояния. Исполнитель хранит свою часть
+таблицы discovered и свою очередь с приоритетами, а порождённые чужие
+состояния отправляет владельцам пачками. Узел глобально адресуется числом
+local_id * workers + owner, поэтому путь восстанавливается последовательными
+запросами к владельцам узлов.
+
+Счётчики статистики исполнители публикуют в общей памяти после каждой
+пачки раскрытий; координатор суммирует их и по ним же проверяет бюджеты
+поиска.
+"""
+
+
+# Per-worker statistics published to the coordinator, in slot order.
+COUNTERS = ('expanded', 'generated', 'duplicates', 'discovered', 'frontier_peak')
+
+
+def owner_of(key, workers):
+    # Python's hash() of bytes is salted per process, so it cannot be used
+    # to agree on the partition between processes.
+    return zlib.crc32(key) % workers
+
+
+class HashDistributedWorker:
+    def __init__(self, index, workers, space, g_weight, h_weight, batch_size, inboxes, results, stop, sent,
+                 received, idle, counters):
+        self.index = index
+        self.workers = workers
+        self.space = space
+        self.g_weight = g_weight
+        self.h_weight = h_weight
+        self.batch_size = batch_size
+        self.inboxes = inboxes
+        self.results = results
+        self.stop = stop
+        self.sent = sent
+        self.received = received
+        self.idle = idle
+        self.counters = counters
+
+        self.parents = array('q')
+        self.moves = array('I')
+        self.costs = array('i')
+        self.closed = bytearray()
+        self.discovered = dict()
+        self.heap = []
+        self.outboxes = [[] for _ in range(workers)]
+        self.commands = []
+
+    def run(self):
+        try:
+            try:
+                while not self.stop.is_set():
+                    self.receive(block=not self.heap)
+                    for _ in range(self.batch_size):
+                        if not self.heap or self.stop.is_set():
+                            break
+                        self.expand()
+                    self.flush()
+                    self.publish()
+            except logic.SearchAborted as exp:
+                self.publish()
+                self.results.put(('aborted', exp.reason))
+            self.serve()
+        finally:
+            # Batches addressed to stopped workers are never read, so they
+            # must not keep this process alive on exit.
+            for inbox in self.inboxes:
+                inbox.cancel_join_thread()
+            self.results.cancel_join_thread()
+
+    def receive(self, block):
+        inbox = self.inboxes[self.index]
+        try:
+            if block:
+                self.idle[self.index] = 1
+                message = inbox.get(timeout=0.05)
+            else:
+                message = inbox.get_nowait()
+            while True:
+                if type(message) is not list:
+                    # Commands are only sent once the search is stopped.
+                    self.commands.append(message)
+                    return
+                self.idle[self.index] = 0
+                self.received[self.index] += 1
+                for item in message:
+                    self.insert(*item)
+                message = inbox.get_nowait()
+        except queue.Empty:
+            pass
+
+    def insert(self, key, state, meta, h, g, parent, move):
+        node = self.discovered.get(key)
+        if node is None:
+            node = len(self.parents)
+            self.discovered[key] = node
+            self.parents.append(parent)
+            self.moves.append(move)
+            self.costs.append(g)
+            self.closed.append(0)
+        elif self.g_weight and g < self.costs[node] and not self.closed[node]:
+            self.parents[node] = parent
+            self.moves[node] = move
+            self.costs[node] = g
+        else:
+            self.space.stats.duplicates += 1
+            return
+        heapq.heappush(self.heap, (self.g_weight * g + self.h_weight * h, h, node, g, state, meta))
+
+    def expand(self):
+        stats = self.space.stats
+        if len(self.heap) > stats.frontier_peak:
+            stats.frontier_peak = len(self.heap)
+        _, h, node, g, state, meta = heapq.heappop(self.heap)
+        if self.closed[node] or g > self.costs[node]:
+            return
+        self.closed[node] = 1
+
+        global_id = node * self.workers + self.index
+        if self.space.is_goal(meta):
+            self.results.put(('found', global_id))
+            return
+
+        for move, new_state, new_meta, new_h, cost in self.space.children(state, meta, h):
+            key = self.space.key(new_state)
+            owner = owner_of(key, self.workers)
+            item = (key, new_state, new_meta, new_h, g + cost, global_id, move)
+            if owner == self.index:
+                self.insert(*item)
+            else:
+                self.outboxes[owner].append(item)
+                if len(self.outboxes[owner]) >= self.batch_size:
+                    self.send(owner)
+
+    def send(self, owner):
+        self.sent[self.index] += 1
+        self.inboxes[owner].put(self.outboxes[owner])
+        self.outboxes[owner] = []
+
+    def flush(self):
+        for owner, batch in enumerate(self.outboxes):
+            if batch:
+                self.send(owner)
+
+    def publish(self):
+        stats = self.space.stats
+        stats.discovered = len(self.parents)
+        base = self.index * len(COUNTERS)
+        for offset, name in enumerate(COUNTERS):
+            self.counters[base + offset] = getattr(stats, name)
+
+    def serve(self):
+        # After the search is stopped the worker only answers path queries.
+        inbox = self.inboxes[self.index]
+        while True:
+            message = self.commands.pop(0) if self.commands else inbox.get()
+            if message == 'exit':
+                return
+            if type(message) is tuple:
+                _, node = message
+                self.results.put(('trace', self.parents[node], self.moves[node]))
+
+
+def run_worker(*args):
+    HashDistributedWorker(*args).run()
+
+
+class HashDistributedSearch:
+    # Satisficing parallel best-first search: the first goal expanded by any
+    # worker is returned, so with g_weight set the cost of the solution is
+    # not bounded (Solver only runs it greedy). g_weight and h_weight have the
+    # same meaning as in search.BestFirstSearch. Every worker expands its own
+    # best node rather than the global best, so the search expands more
+    # nodes than a serial one; whether more cores win that back has not been
+    # measured. Budgets of the space monitor are enforced by every worker for
+    # its own share and by the coordinator for the totals.
+
+    def __init__(self, workers, g_weight=0, h_weight=1, batch_size=256, poll_interval=0.05):
+        if workers < 1:
+            raise ValueError("Number of workers must be positive")
+        self.workers = workers
+        self.g_weight = g_weight
+        self.h_weight = h_weight
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+    def __repr__(self):
+        return (f"HashDistributedSearch(workers={self.workers}, g_weight={self.g_weight}, "
+                f"h_weight={self.h_weight}, batch_size={self.batch_size})")
+
+    def search(self, space):
+        state, meta, h = space.initial()
+        if space.is_goal(meta):
+            return []
+
+        workers = self.workers
+        context = multiprocessing.get_context()
+        inboxes = [context.Queue() for _ in range(workers)]
+        results = context.Queue()
+        stop = context.Event()
+        # The last slot of `sent` belongs to the coordinator.
+        sent = context.RawArray('q', workers + 1)
+        received = context.RawArray('q', workers)
+        idle = context.RawArray('b', workers)
+        counters = context.RawArray('q', workers * len(COUNTERS))
+
+        processes = [context.Process(target=run_worker, daemon=True,
+                                     args=(index, workers, space, self.g_weight, self.h_weight, self.batch_size,
+                                           inboxes, results, stop, sent, received, idle, counters))
+                     for index in range(workers)]
+        for process in processes:
+            process.start()
+
+        try:
+            key = space.key(state)
+            sent[workers] += 1
+            inboxes[owner_of(key, workers)].put([(key, state, meta, h, 0, -1, 0)])
+
+            goal = self.__wait_for_goal(space, processes, results, sent, received, idle, counters)
+            stop.set()
+            if goal is None:
+                return None
+            return self.__trace(goal, processes, inboxes, results)
+        finally:
+            self.__collect_stats(space, counters)
+            stop.set()
+            for inbox in inboxes:
+                inbox.put('exit')
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+
+    def __receive(self, processes, results):
+        try:
+            return results.get(timeout=self.poll_interval)
+        except queue.Empty:
+            if not all(process.is_alive() for process in processes):
+                raise RuntimeError("Parallel search worker died")
+            return None
+
+    def __collect_stats(self, space, counters):
+        # Local frontiers peak at different times, so the sum of the peaks is
+        # an upper bound of the global one.
+        for offset, name in enumerate(COUNTERS):
+            setattr(space.stats, name, sum(counters[offset::len(COUNTERS)]))
+
+    def __wait_for_goal(self, space, processes, results, sent, received, idle, counters):
+        # The search space is exhausted when every worker is idle and every
+        # sent batch has been received; the check must hold twice in a row.
+        previous = None
+        while True:
+            message = self.__receive(processes, results)
+            if message is not None and message[0] == 'found':
+                return message[1]
+            if message is not None and message[0] == 'aborted':
+                space.monitor.abort(message[1])
+
+            self.__collect_stats(space, counters)
+            space.monitor.check()
+
+            total_received = sum(received)
+            snapshot = (all(idle), sum(sent), total_received)
+            if snapshot[0] and snapshot[1] == snapshot[2]:
+                if snapshot == previous:
+                    return None
+                previous = snapshot
+            else:
+                previous = None
+
+    def __trace(self, goal, processes, inboxes, results):
+        path = []
+        node = goal
+        while True:
+            inboxes[node % self.workers].put(('trace', node // self.workers))
+            message = None
+            while message is None or message[0] != 'trace':
+                message = self.__receive(processes, results)
+            _, parent, move = message
+            if parent < 0:
+                break
+            path.append(move)
+            node = parent
+
+        path.reverse()
+        return path
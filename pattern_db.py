@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import collections
+import mmap
+import os
+
+import log
+import logic
+
+
+"""
+Аддитивная база образцов (pattern database) для эвристики решателя.
+
+Для каждого цвета c игра абстрагируется: шарики цвета c остаются собой, все
+остальные становятся неразличимыми шариками X. В абстрактной игре шарик X
+можно класть на X или в пустую колбу, шарик c -- на c или в пустую колбу;
+перенос шарика c стоит 1, перенос X бесплатен. Цель -- собрать все K
+шариков c в одной колбе. Каждый настоящий ход переносит шарик ровно одного
+цвета и допустим в абстракции этого цвета, поэтому сумма абстрактных
+расстояний по всем цветам не превосходит числа перенесённых шариков, то
+есть эвристика допустима (и монотонна).
+
+Абстрактное состояние -- мультимножество колб. Колба высоты h кодируется
+байтом 1 << h | биты шариков (1 -- c, 0 -- X, младший бит -- дно), поэтому
+K не больше 7. Ключ -- отсортированные коды всех N + M колб. База для
+GameParameters строится командой
+    pattern_db.py build N,M,K
+обратным поиском 0-1 BFS от всех целевых состояний и хранится на диске
+отсортированными записями фиксированной длины (ключ и расстояние);
+при поиске файл отображается в память и записи ищутся двоичным поиском.
+"""
+
+
+MAGIC = b'BSPDB\x01'
+HEADER_SIZE = 16
+MAX_CAPACITY = 7
+
+
+def file_name(parameters):
+    return f"pdb_{parameters.N}_{parameters.M}_{parameters.K}.bin"
+
+
+def x_only_partitions(ball_cnt, flask_cnt, capacity, max_height=None):
+    # Multisets of flask heights, as non-increasing tuples.
+    max_height = capacity if max_height is None else max_height
+    if flask_cnt == 0:
+        if ball_cnt == 0:
+            yield ()
+        return
+    for height in range(min(max_height, ball_cnt), -1, -1):
+        if height * flask_cnt < ball_cnt:
+            break
+        for rest in x_only_partitions(ball_cnt - height, flask_cnt - 1, capacity, height):
+            yield (height,) + rest
+
+
+def predecessors(codes, capacity):
+    # Yields (state, cost) for every abstract move leading to `codes`.
+    for b_code in set(codes):
+        b_height = b_code.bit_length() - 1
+        if b_height == 0:
+            continue
+        ball = (b_code >> (b_height - 1)) & 1
+        b_old = (b_code & ((1 << (b_height - 1)) - 1)) | (1 << (b_height - 1))
+        if b_height > 1 and (b_old >> (b_height - 2)) & 1 != ball:
+            continue
+        rest = list(codes)
+        rest.remove(b_code)
+        for a_code in set(rest):
+            a_height = a_code.bit_length() - 1
+            if a_height >= capacity:
+                continue
+            a_old = (a_code & ((1 << a_height) - 1)) | (ball << a_height) | (1 << (a_height + 1))
+            state = list(rest)
+            state.remove(a_code)
+            state.append(a_old)
+            state.append(b_old)
+            state.sort()
+            yield tuple(state), ball
+
+
+def build(parameters):
+    # Returns {key: distance} for every abstract state that can reach the goal.
+    capacity = parameters.K
+    flask_cnt = parameters.N + parameters.M
+    if capacity > MAX_CAPACITY:
+        raise ValueError(f"Pattern databases support capacity up to {MAX_CAPACITY}")
+    if parameters.N > 255 or flask_cnt > 255:
+        raise ValueError("Too many flasks")
+
+    goal_flask = (1 << (capacity + 1)) - 1
+    distances = dict()
+    queue = collections.deque()
+    for heights in x_only_partitions((parameters.N - 1) * capacity, flask_cnt - 1, capacity):
+        state = tuple(sorted((goal_flask,) + tuple(1 << height for height in heights)))
+        distances[state] = 0
+        queue.append((0, state))
+
+    while queue:
+        distance, state = queue.popleft()
+        if distance > distances[state]:
+            continue
+        for previous, cost in predecessors(state, capacity):
+            new_distance = distance + cost
+            known = distances.get(previous)
+            if known is not None and known <= new_distance:
+                continue
+            distances[previous] = new_distance
+            if cost:
+                queue.append((new_distance, previous))
+            else:
+                queue.appendleft((new_distance, previous))
+
+    return {bytes(state): distance for state, distance in distances.items()}
+
+
+def write(path, parameters, distances):
+    if max(distances.values()) > 255:
+        raise ValueError("Distance does not fit into a byte")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'wb') as output:
+        output.write((MAGIC + bytes((parameters.N, parameters.M, parameters.K))).ljust(HEADER_SIZE, b'\0'))
+        for key in sorted(distances):
+            output.write(key + bytes((distances[key],)))
+    os.replace(path + '.tmp', path)
+
+
+class PatternDatabase:
+    def __init__(self, path, parameters):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.path = path
+        self.parameters = parameters
+        self.key_size = parameters.N + parameters.M
+        self.record_size = self.key_size + 1
+        self.file = None
+        self.data = None
+        self.record_cnt = 0
+        self.memo = dict()
+        self.rows = dict()
+
+    def __getstate__(self):
+        # The mapping cannot cross process boundaries; it is reopened lazily.
+        state = self.__dict__.copy()
+        state.update(logger=None, file=None, data=None, memo=dict(), rows=dict())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = log.get_logger(log.class_fullname(self))
+
+    def __open(self):
+        self.file = open(self.path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self.data[:HEADER_SIZE]
+        if header[:len(MAGIC)] != MAGIC or tuple(header[len(MAGIC):len(MAGIC) + 3]) != tuple(self.parameters):
+            raise ValueError(f"{self.path} is not a pattern database for {self.parameters}")
+        self.record_cnt = (len(self.data) - HEADER_SIZE) // self.record_size
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+            self.data = None
+            self.file = None
+
+    def lookup(self, key):
+        # Keys missing from the database contribute nothing.
+        distance = self.memo.get(key)
+        if distance is not None:
+            return distance
+        if self.data is None:
+            self.__open()
+
+        data = self.data
+        record_size = self.record_size
+        key_size = self.key_size
+        low = 0
+        high = self.record_cnt
+        distance = 0
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER_SIZE + middle * record_size
+            record_key = data[offset:offset + key_size]
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                distance = data[offset + key_size]
+                break
+
+        self.memo[key] = distance
+        return distance
+
+    def __row(self, row):
+        # For a flask returns (code of the flask as an X-only one, codes of
+        # the flask in the abstractions of colors present in it).
+        info = self.rows.get(row)
+        if info is None:
+            height = len(row.rstrip(b'\0'))
+            codes = dict()
+            for color in set(row[:height]):
+                code = 1 << height
+                for k in range(height):
+                    if row[k] == color:
+                        code |= 1 << k
+                codes[color] = code
+            complete = height == len(row) and len(codes) == 1
+            info = (1 << height, () if complete else tuple(codes.items()))
+            self.rows[row] = info
+        return info
+
+    def evaluate(self, state):
+        # Sum over colors of abstract distances; colors sitting in a complete
+        # flask are already at distance 0 and are skipped.
+        capacity = self.parameters.K
+        infos = [self.__row(state[offset:offset + capacity]) for offset in range(0, len(state), capacity)]
+        base = [info[0] for info in infos]
+        flasks_by_color = dict()
+        for flask, (_, codes) in enumerate(infos):
+            for color, code in codes:
+                flasks_by_color.setdefault(color, []).append((flask, code))
+
+        total = 0
+        for entries in flasks_by_color.values():
+            codes = base.copy()
+            for flask, code in entries:
+                codes[flask] = code
+            codes.sort()
+            total += self.lookup(bytes(codes))
+        return total
+
+
+class PatternDatabases:
+    # Opens databases of a directory on demand, one per GameParameters.
+
+    def __init__(self, directory='patterns'):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.directory = directory
+        self.databases = dict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['logger'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = log.get_logger(log.class_fullname(self))
+
+    def get(self, parameters):
+        if parameters not in self.databases:
+            path = os.path.join(self.directory, file_name(parameters))
+            if os.path.exists(path):
+                self.databases[parameters] = PatternDatabase(path, parameters)
+            else:
+                self.logger.warning("No pattern database for %s in %s", parameters, self.directory)
+                self.databases[parameters] = None
+        return self.databases[parameters]
+
+
+def parse_parameters(value):
+    return logic.GameParameters(*map(int, value.split(',')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pattern databases for the solver heuristic")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="build databases for the given level shapes")
+    build_parser.add_argument('level', type=parse_parameters, nargs='+', help="level shape as N,M,K")
+    build_parser.add_argument('--directory', default='patterns')
+    args = parser.parse_args()
+
+    logger = log.get_logger('pattern_db')
+    for parameters in args.level:
+        distances = build(parameters)
+        path = os.path.join(args.directory, file_name(parameters))
+        write(path, parameters, distances)
+        logger.info("Built %s: %d states, max distance %d", path, len(distances), max(distances.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import multiprocessing
+import queue
+import time
+
+import log
+import logic
+import search
+
+
+"""
+Портфельное решение: несколько вариантов logic.Solver запускаются
+одновременно в отдельных процессах, побеждает первый нашедший решение.
+Остальные процессы после этого завершаются, и их память освобождается.
+"""
+
+
+DEFAULT_VARIANTS = (
+    dict(strategy=search.AdaptiveStrategy(), canonicalize=True),
+    dict(strategy=search.GreedyBestFirst(), canonicalize=True),
+    dict(strategy=search.GreedyBestFirst(), canonicalize=True, heuristic='flask_fullness'),
+    dict(strategy=search.WeightedAStar(3), canonicalize=True, macro_moves=False),
+)
+
+
+def run_variant(index, variant, game, results):
+    try:
+        results.put((index, logic.Solver(**variant).solve(game), None))
+    except Exception as exp:
+        results.put((index, None, repr(exp)))
+
+
+class PortfolioSolver:
+    # Every variant is a dict of keyword arguments for logic.Solver. Variants
+    # must be picklable, and they should not use workers > 1, as a cancelled
+    # variant is terminated without a chance to stop its own workers. The
+    # time limit applies to the whole race; when it runs out every variant
+    # is terminated and SearchAborted is raised.
+
+    def __init__(self, variants=DEFAULT_VARIANTS, poll_interval=0.05, cache=None, time_limit=None):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.variants = list(variants)
+        self.poll_interval = poll_interval
+        self.cache = cache
+        self.time_limit = time_limit
+
+    def solve(self, initial_game):
+        if self.cache is not None:
+            solution = self.cache.get(initial_game)
+            if solution is not None:
+                self.logger.info("Found cached solution")
+                return solution
+
+        solution = self.__race(initial_game)
+        if solution is not None and self.cache is not None:
+            self.cache.put(initial_game, solution)
+        return solution
+
+    def __race(self, initial_game):
+        context = multiprocessing.get_context()
+        results = context.Queue()
+        processes = [context.Process(target=run_variant, args=(index, variant, initial_game, results))
+                     for index, variant in enumerate(self.variants)]
+        for process in processes:
+            process.start()
+
+        try:
+            deadline = None if self.time_limit is None else time.monotonic() + self.time_limit
+            pending = set(range(len(processes)))
+            dead = set()
+            while pending:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise logic.SearchAborted('time')
+                try:
+                    index, solution, error = results.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    # A variant killed from outside never reports back. Its
+                    # result may still be in flight right after it exits, so
+                    # it is given up on only on the next poll.
+                    pending -= dead
+                    dead = {index for index in pending if not processes[index].is_alive()}
+                    continue
+
+                pending.discard(index)
+                if error is not None:
+                    self.logger.warning("Variant %s failed: %s", self.variants[index], error)
+                elif solution is not None:
+                    self.logger.info("Variant %s won with %d moves", self.variants[index], len(solution) - 1)
+                    return solution
+
+            return None
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
+                process.close()
+            results.close()
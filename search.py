@@ -0,0 +1,304 @@
+import heapq
+from array import array
+
+
+"""
+Движки поиска для logic.Solver.
+
+Каждый движок получает пространство поиска (logic.SearchSpace) и возвращает
+список ходов от начального состояния до выигрышного либо None, если решение
+не найдено. Пространство поиска предоставляет:
+ - initial() -> (state, meta, h);
+ - children(state, meta, h) -> итератор (move, state, meta, h, cost);
+ - is_goal(meta);
+ - key(state) -> ключ для поиска дубликатов.
+"""
+
+
+class SearchTree:
+    # Node i is stored as a (parents[i], moves[i]) pair; the states themselves
+    # live only in the frontier and as keys of `discovered`.
+
+    def __init__(self):
+        self.parents = array('i')
+        self.moves = array('I')
+        self.discovered = dict()
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, key, parent, move):
+        node = len(self.parents)
+        self.parents.append(parent)
+        self.moves.append(move)
+        self.discovered[key] = node
+        return node
+
+    def reparent(self, node, parent, move):
+        self.parents[node] = parent
+        self.moves[node] = move
+
+    def path(self, node):
+        result = []
+        while self.parents[node] >= 0:
+            result.append(self.moves[node])
+            node = self.parents[node]
+        result.reverse()
+        return result
+
+
+class BestFirstSearch:
+    # Expands nodes in order of g_weight * g + h_weight * h. Ties are broken
+    # by smaller h, then in FIFO order. With cost_bound set, nodes with
+    # g + h >= cost_bound are pruned, so only solutions cheaper than the bound
+    # are found; this is exact only for an admissible h.
+
+    def __init__(self, g_weight=1, h_weight=1, cost_bound=None):
+        self.g_weight = g_weight
+        self.h_weight = h_weight
+        self.cost_bound = cost_bound
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(g_weight={self.g_weight}, h_weight={self.h_weight}, "
+                f"cost_bound={self.cost_bound})")
+
+    def search(self, space):
+        tree = SearchTree()
+        state, meta, h = space.initial()
+        root = tree.add(space.key(state), -1, 0)
+        costs = array('i', [0])
+        closed = bytearray(1)
+
+        heap = [(self.h_weight * h, h, root, 0, state, meta)]
+        try:
+            return self.__run(space, tree, heap, costs, closed)
+        finally:
+            space.stats.discovered = len(tree)
+
+    def __run(self, space, tree, heap, costs, closed):
+        g_weight = self.g_weight
+        h_weight = self.h_weight
+        cost_bound = self.cost_bound
+        stats = space.stats
+
+        while heap:
+            if len(heap) > stats.frontier_peak:
+                stats.frontier_peak = len(heap)
+            _, h, node, g, state, meta = heapq.heappop(heap)
+            if closed[node] or g > costs[node]:
+                continue
+            closed[node] = 1
+
+            if space.is_goal(meta):
+                return tree.path(node)
+
+            for move, new_state, new_meta, new_h, cost in space.children(state, meta, h):
+                new_g = g + cost
+                if cost_bound is not None and new_g + new_h >= cost_bound:
+                    continue
+                key = space.key(new_state)
+                new_node = tree.discovered.get(key)
+                if new_node is None:
+                    new_node = tree.add(key, node, move)
+                    costs.append(new_g)
+                    closed.append(0)
+                elif g_weight and new_g < costs[new_node] and not closed[new_node]:
+                    # Closed nodes are never reopened: their children already
+                    # refer to the physical state they were expanded from.
+                    tree.reparent(new_node, node, move)
+                    costs[new_node] = new_g
+                else:
+                    stats.duplicates += 1
+                    continue
+                heapq.heappush(heap, (g_weight * new_g + h_weight * new_h, new_h, new_node, new_g, new_state, new_meta))
+
+        return None
+
+
+class GreedyBestFirst(BestFirstSearch):
+    def __init__(self):
+        super().__init__(g_weight=0, h_weight=1)
+
+    def __repr__(self):
+        return "GreedyBestFirst()"
+
+
+class AStar(BestFirstSearch):
+    def __init__(self):
+        super().__init__(g_weight=1, h_weight=1)
+
+    def __repr__(self):
+        return "AStar()"
+
+
+class WeightedAStar(BestFirstSearch):
+    def __init__(self, weight=2, cost_bound=None):
+        super().__init__(g_weight=1, h_weight=weight, cost_bound=cost_bound)
+
+    def __repr__(self):
+        if self.cost_bound is None:
+            return f"WeightedAStar(weight={self.h_weight})"
+        return f"WeightedAStar(weight={self.h_weight}, cost_bound={self.cost_bound})"
+
+
+class IterativeDeepeningAStar:
+    # Keeps only the current path in memory plus a transposition table of at
+    # most `table_size` entries, which is cleared on every iteration.
+
+    def __init__(self, table_size=100000):
+        self.table_size = table_size
+
+    def __repr__(self):
+        return f"IterativeDeepeningAStar(table_size={self.table_size})"
+
+    def search(self, space):
+        state, meta, h = space.initial()
+        if space.is_goal(meta):
+            return []
+
+        bound = h
+        while bound is not None:
+            path, bound = self.__bounded_search(space, state, meta, h, bound)
+            if path is not None:
+                return path
+
+        return None
+
+    def __bounded_search(self, space, state, meta, h, bound):
+        path = []
+        root_key = space.key(state)
+        path_keys = {root_key}
+        table = {root_key: 0}
+        stack = [(0, space.children(state, meta, h), None)]
+        try:
+            return self.__run(space, bound, path, path_keys, table, stack)
+        finally:
+            space.stats.discovered = max(space.stats.discovered, len(table))
+
+    def __run(self, space, bound, path, path_keys, table, stack):
+        next_bound = None
+        stats = space.stats
+
+        while stack:
+            if len(stack) > stats.frontier_peak:
+                stats.frontier_peak = len(stack)
+            g, children, key = stack[-1]
+            for move, new_state, new_meta, new_h, cost in children:
+                new_g = g + cost
+                f = new_g + new_h
+                if f > bound:
+                    if next_bound is None or f < next_bound:
+                        next_bound = f
+                    continue
+
+                new_key = space.key(new_state)
+                if new_key in path_keys:
+                    stats.duplicates += 1
+                    continue
+                known_g = table.get(new_key)
+                if known_g is not None and known_g <= new_g:
+                    stats.duplicates += 1
+                    continue
+                if known_g is not None or len(table) < self.table_size:
+                    table[new_key] = new_g
+
+                path.append(move)
+                if space.is_goal(new_meta):
+                    return path, bound
+
+                path_keys.add(new_key)
+                stack.append((new_g, space.children(new_state, new_meta, new_h), new_key))
+                break
+            else:
+                stack.pop()
+                if key is not None:
+                    path_keys.discard(key)
+                    path.pop()
+
+        return None, next_bound
+
+
+class BeamSearch:
+    # Breadth-first search which keeps only `width` best nodes of every layer,
+    # so memory is bounded by width * depth. It is not complete.
+
+    def __init__(self, width=1000):
+        self.width = width
+
+    def __repr__(self):
+        return f"BeamSearch(width={self.width})"
+
+    def search(self, space):
+        tree = SearchTree()
+        state, meta, h = space.initial()
+        root = tree.add(space.key(state), -1, 0)
+        if space.is_goal(meta):
+            return []
+
+        layer = [(h, root, state, meta)]
+        try:
+            return self.__run(space, tree, layer)
+        finally:
+            space.stats.discovered = len(tree)
+
+    def __run(self, space, tree, layer):
+        stats = space.stats
+        while layer:
+            candidates = dict()
+            for h, node, state, meta in layer:
+                for move, new_state, new_meta, new_h, _ in space.children(state, meta, h):
+                    key = space.key(new_state)
+                    if key in tree.discovered or key in candidates:
+                        stats.duplicates += 1
+                        continue
+                    if space.is_goal(new_meta):
+                        return tree.path(node) + [move]
+                    candidates[key] = (new_h, len(candidates), key, node, move, new_state, new_meta)
+
+            if len(candidates) > stats.frontier_peak:
+                stats.frontier_peak = len(candidates)
+
+            layer = []
+            for new_h, _, key, node, move, new_state, new_meta in heapq.nsmallest(self.width, candidates.values()):
+                layer.append((new_h, tree.add(key, node, move), new_state, new_meta))
+
+        return None
+
+
+class AdaptiveStrategy:
+    # Picks an engine by the level size: move-optimal A* on small levels,
+    # weighted A* on medium ones and memory-bounded beam search on big ones.
+    # Beam search is not complete, so greedy search is used as a fallback.
+
+    def __init__(self, small_ball_cnt=24, medium_flask_cnt=11, beam_width=500):
+        self.small_ball_cnt = small_ball_cnt
+        self.medium_flask_cnt = medium_flask_cnt
+        self.beam_width = beam_width
+
+    def __repr__(self):
+        return (f"AdaptiveStrategy(small_ball_cnt={self.small_ball_cnt}, "
+                f"medium_flask_cnt={self.medium_flask_cnt}, beam_width={self.beam_width})")
+
+    def select(self, parameters):
+        if parameters.N * parameters.K <= self.small_ball_cnt:
+            return AStar()
+        if parameters.N + parameters.M <= self.medium_flask_cnt:
+            return WeightedAStar(2)
+        return BeamSearch(self.beam_width)
+
+    def search(self, space):
+        strategy = self.select(space.parameters)
+        path = strategy.search(space)
+        if path is None and isinstance(strategy, BeamSearch):
+            path = GreedyBestFirst().search(space)
+        return path
+
+
+STRATEGIES = {
+    'greedy': GreedyBestFirst,
+    'astar': AStar,
+    'wastar': WeightedAStar,
+    'idastar': IterativeDeepeningAStar,
+    'beam': BeamSearch,
+    'adaptive': AdaptiveStrategy,
+}
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+import log
+import logic
+
+
+"""
+Постоянный кэш решений.
+
+Ключ -- сериализованная конфигурация с колбами, упорядоченными по
+содержимому, поэтому один и тот же уровень находится независимо от порядка
+колб на экране. Значение -- последовательность однобалльных ходов в
+индексах канонического порядка. Записи хранятся в SQLite и вытесняются по
+давности использования; перед базой стоит небольшой LRU-кэш в памяти.
+"""
+
+
+class SolutionCache:
+    def __init__(self, path, max_entries=100000, memory_entries=1024):
+        self.logger = log.get_logger(log.class_fullname(self))
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        # last_used of memory hits, written to the database by put() and
+        # close()
+        self.touched = dict()
+        self.connection = None
+        self.entry_cnt = 0
+
+    def __getstate__(self):
+        # The connection cannot cross process boundaries; it is reopened
+        # lazily on first use.
+        state = self.__dict__.copy()
+        state['connection'] = None
+        state['logger'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = log.get_logger(log.class_fullname(self))
+
+    def __connect(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # AnytimeSolver uses the cache from a new search thread for every
+            # level; the uses never overlap.
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS solutions ("
+                                    "key TEXT PRIMARY KEY, moves TEXT NOT NULL, last_used INTEGER NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)")
+            self.connection.commit()
+            self.entry_cnt = self.connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        return self.connection
+
+    def close(self):
+        if self.touched:
+            connection = self.__connect()
+            with connection:
+                self.__write_touched(connection)
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @staticmethod
+    def canonical_form(configuration):
+        # order[k] is the physical index of the k-th flask in canonical order.
+        flasks = [logic.Game.serialize_configuration((flask,)) for flask in configuration]
+        order = sorted(range(len(flasks)), key=lambda i: flasks[i])
+        return ';'.join(flasks[i] for i in order), order
+
+    def get(self, game):
+        key, order = SolutionCache.canonical_form(game.configuration)
+        moves = self.__lookup(key)
+        if moves is None:
+            return None
+
+        solution = [game.configuration]
+        try:
+            for i, j in moves:
+                game = game.do_a_move(order[i], order[j])
+                solution.append(game.configuration)
+        except (ValueError, IndexError):
+            game = None
+
+        if game is None or not game.is_winning_configuration():
+            self.logger.warning("Dropping invalid cached solution for %s", key)
+            self.__delete(key)
+            return None
+
+        return solution
+
+    def put(self, game, solution):
+        key, order = SolutionCache.canonical_form(game.configuration)
+        position = {physical: canonical for canonical, physical in enumerate(order)}
+        moves = [(position[i], position[j]) for i, j in logic.Solver.moves_from_solution(solution)]
+
+        self.__remember(key, moves)
+        connection = self.__connect()
+        with connection:
+            # INSERT OR REPLACE reports one changed row for a replacement as
+            # well, so only keys that were not stored yet are counted.
+            known = connection.execute("SELECT 1 FROM solutions WHERE key = ?", (key,)).fetchone() is not None
+            connection.execute("INSERT OR REPLACE INTO solutions (key, moves, last_used) VALUES (?, ?, ?)",
+                               (key, SolutionCache.__serialize_moves(moves), time.time_ns()))
+            if not known:
+                self.entry_cnt += 1
+            if self.entry_cnt > self.max_entries:
+                self.__write_touched(connection)
+                self.__evict(connection)
+
+    def __lookup(self, key):
+        moves = self.memory.get(key)
+        if moves is not None:
+            self.memory.move_to_end(key)
+            self.touched[key] = time.time_ns()
+            return moves
+
+        connection = self.__connect()
+        row = connection.execute("SELECT moves FROM solutions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        with connection:
+            connection.execute("UPDATE solutions SET last_used = ? WHERE key = ?", (time.time_ns(), key))
+        moves = SolutionCache.__deserialize_moves(row[0])
+        self.__remember(key, moves)
+        return moves
+
+    def __remember(self, key, moves):
+        self.memory[key] = moves
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def __write_touched(self, connection):
+        connection.executemany("UPDATE solutions SET last_used = ? WHERE key = ?",
+                               [(last_used, key) for key, last_used in self.touched.items()])
+        self.touched.clear()
+
+    def __delete(self, key):
+        self.memory.pop(key, None)
+        self.touched.pop(key, None)
+        connection = self.__connect()
+        with connection:
+            connection.execute("DELETE FROM solutions WHERE key = ?", (key,))
+        self.entry_cnt = connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def __evict(self, connection):
+        excess = self.entry_cnt - self.max_entries
+        connection.execute("DELETE FROM solutions WHERE key IN "
+                           "(SELECT key FROM solutions ORDER BY last_used LIMIT ?)", (excess,))
+        self.entry_cnt = connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        self.logger.debug("Evicted %d cached solutions", excess)
+
+    @staticmethod
+    def __serialize_moves(moves):
+        return ','.join(f"{i}-{j}" for i, j in moves)
+
+    @staticmethod
+    def __deserialize_moves(value):
+        if not value:
+            return []
+        return [tuple(map(int, move.split('-'))) for move in value.split(',')]
@@ -0,0 +1,181 @@
+import numpy as np
+
+
+"""
+Пакетная генерация ходов на NumPy.
+
+Слой поиска хранится как массив uint8 формы (B, F, K): B состояний, F колб,
+K ячеек в колбе, дно колбы -- ячейка 0, пустые ячейки -- нули (тот же
+формат, что у упакованных состояний logic.StateCodec). Высоты колб и цвета
+верхних шариков получаются векторами, допустимые ходы всего слоя --
+булевым массивом (B, F, F), а дети всего слоя строятся одной операцией.
+Поэтому поиск по слоям (лучевой поиск и поиск в ширину) почти всё время
+проводит внутри NumPy, а не в интерпретаторе.
+
+NumPy используется только в этом модуле.
+"""
+
+
+class StateBatch:
+    # Derived per-state vectors of a (B, F, K) layer.
+
+    def __init__(self, states):
+        self.states = states
+        capacity = states.shape[2]
+        self.heights = np.count_nonzero(states, axis=2)
+        rows = np.arange(states.shape[0])[:, None]
+        flasks = np.arange(states.shape[1])[None, :]
+        self.tops = np.where(self.heights > 0, states[rows, flasks, np.maximum(self.heights - 1, 0)], 0)
+        uniform = np.all(states == states[:, :, :1], axis=2)
+        self.complete = (self.heights == capacity) & uniform
+        self.settled = self.complete | (self.heights == 0)
+
+    def legal_moves(self):
+        # The same rules as StateCodec.moves(): a ball goes onto an empty
+        # flask or onto a ball of its own color, and complete flasks stay.
+        heights = self.heights
+        capacity = self.states.shape[2]
+        can_src = (heights > 0) & ~self.complete
+        can_dst = heights < capacity
+        same_top = (self.tops[:, :, None] == self.tops[:, None, :]) | (heights[:, None, :] == 0)
+        mask = can_src[:, :, None] & can_dst[:, None, :] & same_top
+        mask &= ~np.eye(heights.shape[1], dtype=bool)[None, :, :]
+        return mask
+
+    def expand(self):
+        # Returns (parents, sources, destinations, children) for every legal
+        # single-ball move of every state of the batch.
+        parents, sources, destinations = np.nonzero(self.legal_moves())
+        children = self.states[parents]
+        index = np.arange(len(parents))
+        children[index, sources, self.heights[parents, sources] - 1] = 0
+        children[index, destinations, self.heights[parents, destinations]] = self.tops[parents, sources]
+        return parents, sources, destinations, children
+
+
+def color_changes(states):
+    return np.count_nonzero((states[:, :, 1:] != states[:, :, :-1]) & (states[:, :, 1:] != 0), axis=(1, 2))
+
+
+def flask_fullness(states):
+    heights = np.count_nonzero(states, axis=2)
+    return np.minimum(heights, states.shape[2] - heights).sum(axis=1)
+
+
+def is_winning(states):
+    return np.all(StateBatch(states).settled, axis=1)
+
+
+class StateHasher:
+    # 64-bit keys of states. Keys of different states may collide with
+    # probability about n^2 / 2^64 for n states, which only makes a search
+    # skip a state. With canonicalize set flasks are sorted first, so states
+    # that differ by the order of flasks share a key.
+
+    def __init__(self, flask_cnt, capacity, canonicalize, seed=0):
+        rng = np.random.default_rng(seed)
+        self.slot_weights = rng.integers(1, 2 ** 63, size=capacity, dtype=np.uint64) | np.uint64(1)
+        self.flask_weights = rng.integers(1, 2 ** 63, size=flask_cnt, dtype=np.uint64) | np.uint64(1)
+        self.canonicalize = canonicalize
+
+    def keys(self, states):
+        flasks = (states.astype(np.uint64) * self.slot_weights).sum(axis=2, dtype=np.uint64)
+        # Mixing makes the per-flask hashes independent of each other before
+        # they are combined by position.
+        flasks ^= flasks >> np.uint64(29)
+        flasks *= np.uint64(0xbf58476d1ce4e5b9)
+        flasks ^= flasks >> np.uint64(32)
+        if self.canonicalize:
+            flasks.sort(axis=1)
+        return (flasks * self.flask_weights).sum(axis=1, dtype=np.uint64)
+
+
+class VectorizedBeamSearch:
+    # Layered search over single-ball moves that expands a whole layer with
+    # NumPy. Every layer keeps the `width` children with the smallest
+    # heuristic; with width=None nothing is cut and the search is an
+    # exhaustive breadth-first search returning a shortest solution.
+    # Duplicates are detected by StateHasher keys, not by space.key().
+    # Only single-ball moves and the color_changes and flask_fullness
+    # heuristics are supported, other options of the space raise ValueError.
+    # Dead ends are not pruned: the layer is expanded without
+    # space.children(), so stats.dead_ends stays zero.
+
+    def __init__(self, width=1000):
+        self.width = width
+
+    def __repr__(self):
+        return f"VectorizedBeamSearch(width={self.width})"
+
+    def search(self, space):
+        codec = space.codec
+        flask_cnt = codec.flask_cnt
+        capacity = codec.capacity
+        stats = space.stats
+        if space.macro_moves:
+            raise ValueError(f"Macro moves are not supported by {self}")
+        if space.relabel_colors:
+            raise ValueError(f"Color relabeling is not supported by {self}")
+        if space.heuristic not in ('color_changes', 'flask_fullness'):
+            raise ValueError(f"Heuristic {space.heuristic} is not supported by {self}")
+        heuristic = flask_fullness if space.heuristic == 'flask_fullness' else color_changes
+        hasher = StateHasher(flask_cnt, capacity, space.canonicalize)
+
+        state, meta, _ = space.initial()
+        if space.is_goal(meta):
+            return []
+
+        layer = np.frombuffer(state, dtype=np.uint8).reshape(1, flask_cnt, capacity).copy()
+        nodes = np.zeros(1, dtype=np.int64)
+        discovered = hasher.keys(layer)
+        parents = [np.full(1, -1, dtype=np.int64)]
+        moves = [np.zeros(1, dtype=np.int64)]
+        node_cnt = 1
+
+        try:
+            while len(layer):
+                stats.expanded += len(layer)
+                space.monitor.check()
+
+                batch_parents, sources, destinations, children = StateBatch(layer).expand()
+                stats.generated += len(children)
+
+                keys = hasher.keys(children)
+                _, first = np.unique(keys, return_index=True)
+                first.sort()
+                fresh = first[~np.isin(keys[first], discovered, assume_unique=True)]
+                stats.duplicates += len(children) - len(fresh)
+
+                winning = np.flatnonzero(is_winning(children[fresh]))
+                if len(winning):
+                    child = fresh[winning[0]]
+                    path = VectorizedBeamSearch.__path(parents, moves, int(nodes[batch_parents[child]]))
+                    return path + [codec.encode_move(int(sources[child]), int(destinations[child]))]
+
+                if self.width is not None and len(fresh) > self.width:
+                    scores = heuristic(children[fresh])
+                    # Ties are broken by generation order, as in BeamSearch.
+                    fresh = fresh[np.lexsort((fresh, scores))[:self.width]]
+                stats.frontier_peak = max(stats.frontier_peak, len(fresh))
+
+                discovered = np.union1d(discovered, keys[fresh])
+                parents.append(nodes[batch_parents[fresh]])
+                moves.append((flask_cnt + sources[fresh]) * flask_cnt + destinations[fresh])
+                nodes = np.arange(node_cnt, node_cnt + len(fresh), dtype=np.int64)
+                node_cnt += len(fresh)
+                layer = children[fresh]
+
+            return None
+        finally:
+            stats.discovered = node_cnt
+
+    @staticmethod
+    def __path(parents, moves, node):
+        parents = np.concatenate(parents)
+        moves = np.concatenate(moves)
+        result = []
+        while parents[node] >= 0:
+            result.append(int(moves[node]))
+            node = int(parents[node])
+        result.reverse()
+        return result